@@ -17,6 +17,8 @@ pub struct MapMessage {
     pub wind_speed: Option<f64>,
     /// (Optional) Global wind direction in degrees
     pub wind_direction: Option<f64>,
+    /// (Optional) Number of realisations behind the cell probabilities
+    pub ensemble_size: Option<u32>,
 }
 
 #[derive(Clone, Debug, Serialize, Deserialize)]
@@ -27,4 +29,6 @@ pub struct MapCell {
     pub longitude: f64,
     /// Value at the grid cell
     pub value: f64,
+    /// (Optional) Probability of the cell to burn within the forecast horizon
+    pub probability: Option<f64>,
 }
\ No newline at end of file
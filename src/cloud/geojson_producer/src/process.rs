@@ -26,14 +26,16 @@ fn gen_forest_area(cell: &map_message::MapCell, cell_size_lat: f64, cell_size_lo
         ))),
         properties: Some(
             [
-                (
+                Some((
                     "status".to_string(),
                     JsonValue::Number(serde_json::Number::from_f64(cell.value).unwrap()),
-                ),
-                //("risk".to_string(), JsonValue::Number(serde_json::Number::from_f64(cell.value).unwrap())),
+                )),
+                cell.probability
+                    .and_then(serde_json::Number::from_f64)
+                    .map(|risk| ("risk".to_string(), JsonValue::Number(risk))),
             ]
-            .iter()
-            .cloned()
+            .into_iter()
+            .flatten()
             .collect(),
         ),
         foreign_members: None,
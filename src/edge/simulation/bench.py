@@ -0,0 +1,163 @@
+"""
+Headless simulation benchmark.
+
+Drives a simulation engine on a simulated clock, with no MQTT broker, no MinIO
+and no sleeps, and reports steps/sec, per-phase timings and peak memory.
+
+    uv run bench.py --grid-size 64 256 1024 --sensors 100 --steps 50 --seed 42
+"""
+import argparse
+import contextlib
+import io
+import json
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+from engine import SimulationEngine
+from sparse_engine import SparseSimulationEngine
+from tiled_engine import TiledSimulationEngine
+from publisher import SensorPublisher
+
+# Same area as map.geojson
+DEFAULT_BBOX = [5.50, 43.55, 5.65, 43.70]
+
+PHASES = ["wind", "spread", "regrowth", "heat", "tiles", "sensors", "snapshot", "payloads", "satellite"]
+
+
+def synthetic_map(grid_size, sensor_count, seed, bbox=DEFAULT_BBOX):
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(bbox[0], bbox[2], sensor_count)
+    lat = rng.uniform(bbox[1], bbox[3], sensor_count)
+    return {
+        "bbox": bbox,
+        "width": grid_size,
+        "height": grid_size,
+        "sensors": [
+            {
+                "device_id": i,
+                "location": {"latitude": lat[i], "longitude": lon[i], "altitude": 0},
+                "forest_area": "bench",
+            }
+            for i in range(sensor_count)
+        ],
+    }
+
+
+def create_engine(mode, map, seed, workers, tile_size, compact=False):
+    if mode == "sparse":
+        return SparseSimulationEngine(map, seed=seed, compact=compact)
+    if mode == "tiled":
+        return TiledSimulationEngine(map, tile_size=tile_size, workers=workers, seed=seed, compact=compact)
+    return SimulationEngine(map, vectorized=mode != "loop", seed=seed, compact=compact)
+
+
+def peak_memory_mib(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KiB on Linux, a high-water mark over the whole process lifetime
+    # (RUSAGE_CHILDREN: of the largest terminated child)
+    return resource.getrusage(who).ru_maxrss / 1024
+
+
+def run_benchmark(grid_size, sensor_count, steps, seed, mode="vectorized", workers=None, tile_size=256,
+                  satellite_every=5, payload_format="records", compact=False, step_seconds=1.0):
+    map = synthetic_map(grid_size, sensor_count, seed)
+    # The engines print fire starts, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        setup_start = time.perf_counter()
+        sim = create_engine(mode, map, seed, workers, tile_size, compact)
+        setup_time = time.perf_counter() - setup_start
+        sim.start_fire()
+        sim.enable_timings()
+        encoder = SensorPublisher(None, sim.sensors.ids.tolist()) if payload_format == "json" else None
+
+        clock = 0.0
+        run_start = time.perf_counter()
+        for step in range(steps):
+            sim.step()
+            clock += step_seconds
+            with sim.timed("payloads"):
+                if payload_format == "dict":
+                    sim.generate_sensor_payloads(timestamp=clock)
+                elif payload_format == "json":
+                    encoder.encode(clock, sim.sensors.readings)
+                else:
+                    sim.generate_sensor_records(timestamp=clock)
+            if satellite_every and step % satellite_every == 0:
+                with sim.timed("satellite"):
+                    sim.generate_satellite_payload()
+        run_time = time.perf_counter() - run_start
+
+    result = {
+        "mode": mode,
+        "compact": compact,
+        "grid_size": grid_size,
+        "sensors": sensor_count,
+        "steps": steps,
+        "seed": seed,
+        "setup_s": setup_time,
+        "steps_per_sec": steps / run_time,
+        "phases_ms": {phase: sim.timings[phase] / steps * 1000 for phase in PHASES if phase in sim.timings},
+        "burnt_fraction": float(np.count_nonzero(sim.env.fire_grid == -1) / sim.env.fire_grid.size),
+        "peak_memory_mib": peak_memory_mib(),
+    }
+    if isinstance(sim, TiledSimulationEngine):
+        # Workers exit on close, their peak is then reported (shared grids count in each)
+        sim.close()
+        result["worker_peak_memory_mib"] = peak_memory_mib(resource.RUSAGE_CHILDREN)
+    return result
+
+
+def run_isolated(*args, **kwargs):
+    """run_benchmark in a fresh process, so that its peak memory is its own."""
+    with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(run_benchmark, *args, **kwargs).result()
+
+
+def print_result(result):
+    phases = " ".join(f"{phase}={ms:.2f}" for phase, ms in result["phases_ms"].items())
+    workers = f" (worker {result['worker_peak_memory_mib']:.0f} MiB)" if "worker_peak_memory_mib" in result else ""
+    print(
+        f"{result['mode']:>10} {result['grid_size']:>6}² {result['sensors']:>6} sensors | "
+        f"{result['steps_per_sec']:8.2f} steps/s | setup {result['setup_s']:.2f}s | "
+        f"peak {result['peak_memory_mib']:.0f} MiB{workers} | ms/step: {phases}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless fire simulation benchmark")
+    parser.add_argument("--grid-size", type=int, nargs="+", default=[64], help="Grid side(s), one run per size")
+    parser.add_argument("--sensors", type=int, default=20, help="Number of simulated stations")
+    parser.add_argument("--steps", type=int, default=50, help="Steps per run")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the map and of the simulation")
+    parser.add_argument("--mode", choices=["vectorized", "sparse", "tiled", "loop"], default="vectorized")
+    parser.add_argument("--workers", type=int, default=None, help="Tiled mode: worker processes")
+    parser.add_argument("--tile-size", type=int, default=256, help="Tiled mode: tile side")
+    parser.add_argument("--satellite-every", type=int, default=5, help="Encode a satellite image every N steps (0: never)")
+    parser.add_argument("--payload-format", choices=["records", "dict", "json"], default="records",
+                        help="Sensor payloads as one structured array, one dict per sensor or encoded JSON messages")
+    parser.add_argument("--compact", action="store_true", help="int8 fire state and float32 fields")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per run")
+    args = parser.parse_args()
+
+    for grid_size in args.grid_size:
+        result = run_isolated(
+            grid_size,
+            args.sensors,
+            args.steps,
+            args.seed,
+            mode=args.mode,
+            workers=args.workers,
+            tile_size=args.tile_size,
+            satellite_every=args.satellite_every,
+            payload_format=args.payload_format,
+            compact=args.compact,
+        )
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print_result(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Checkpoints of a running simulation: one .npy file per grid and a manifest.
+
+    checkpoint/
+        manifest.json       engine, map, generator state and scalars
+        env.fire_grid.npy   environment grids
+        engine.*.npy        engine arrays (burnt ages, sensor readings, ...)
+
+Checkpoints are written to a temporary directory renamed into place, so a
+crash never leaves a half-written checkpoint. On resume the grids are
+memory-mapped copy-on-write: pages are only read when the simulation first
+touches them and the files are never modified.
+"""
+import json
+import os
+import shutil
+import time
+import numpy as np
+from environment import Environment
+
+CHECKPOINT_VERSION = 1
+
+# Environment grids needed to continue a run (direction and slope terms are derived)
+ENV_GRIDS = [
+    "altitude_map",
+    "temp_map",
+    "air_hum_map",
+    "soil_hum_map",
+    "pressure_map",
+    "rain_map",
+    "wind_speed_map",
+    "wind_dir_map",
+    "wind_u",
+    "wind_v",
+    "fire_grid",
+]
+
+
+def _map_signature(map):
+    return {
+        "width": map["width"],
+        "height": map["height"],
+        "bbox": list(map["bbox"]),
+        "sensors": [s["device_id"] for s in map["sensors"]],
+    }
+
+
+def save_checkpoint(sim, map, directory):
+    start = time.perf_counter()
+    directory = os.path.abspath(directory)
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    old = f"{directory}.old"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    arrays, scalars = sim.checkpoint_state()
+    files = {f"env.{name}": getattr(sim.env, name) for name in ENV_GRIDS}
+    files |= {f"engine.{name}": array for name, array in arrays.items()}
+    for name, array in files.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), array)
+
+    manifest = {
+        "version": CHECKPOINT_VERSION,
+        "engine": type(sim).__name__,
+        "map": _map_signature(map),
+        "rng": sim.rng.bit_generator.state,
+        "scalars": scalars,
+        "arrays": sorted(arrays),
+        "saved_at": time.time(),
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+
+    # Keep the previous checkpoint until the new one is in place
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+    print(f"Checkpoint saved to {directory} in {time.perf_counter() - start:.2f}s")
+
+
+def load_checkpoint(directory, map, engine_cls, **engine_kwargs):
+    """
+    Resume an engine of `engine_cls` from `directory`. Raises FileNotFoundError
+    when there is no checkpoint and ValueError when it belongs to another
+    engine or map.
+    """
+    start = time.perf_counter()
+    directory = os.path.abspath(directory)
+    if not os.path.exists(os.path.join(directory, "manifest.json")) and os.path.exists(f"{directory}.old"):
+        # Interrupted while swapping checkpoints
+        directory = f"{directory}.old"
+    with open(os.path.join(directory, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    if manifest["version"] != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {manifest['version']}")
+    if manifest["engine"] != engine_cls.__name__:
+        raise ValueError(f"Checkpoint of a {manifest['engine']}, not a {engine_cls.__name__}")
+    if manifest["map"] != _map_signature(map):
+        raise ValueError("Checkpoint of another map")
+
+    def load(name):
+        return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="c")
+
+    rng = np.random.default_rng()
+    env = Environment.from_arrays(
+        {name: load(f"env.{name}") for name in ENV_GRIDS},
+        static_terms=engine_cls.static_terms,
+        rng=rng,
+    )
+    sim = engine_cls(map, seed=rng, env=env, **engine_kwargs)
+
+    # Restored last: building the engine draws from the generator
+    rng.bit_generator.state = manifest["rng"]
+    sim.restore_checkpoint_state({name: load(f"engine.{name}") for name in manifest["arrays"]}, manifest["scalars"])
+    sim.publish_snapshot()
+    print(f"Resumed {engine_cls.__name__} from {directory} in {time.perf_counter() - start:.2f}s")
+    return sim
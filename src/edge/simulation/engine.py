@@ -1,27 +1,61 @@
-from sensor import Sensor
+from sensor import SensorRegistry
+from satellite import SatelliteFeedEncoder, SatelliteRenderer
+from snapshot import FireGridLog, Snapshot
 from environment import Environment
+from spread import STREAM_REGROW, STREAM_SPREAD, random_field, regrow, spread_fire
 import datetime
+import time
+from collections import defaultdict
+from contextlib import contextmanager
 import numpy as np
-import random
-import scipy.ndimage
-from PIL import Image
-import io
+
+# Sensors read the max temperature and mean conditions over a (2r+1)x(2r+1) window
+SENSOR_RADIUS = 2
+ABERRANT_PROB = 0.05  # 5% chance
+# Extreme values injected instead of a reading, one row per reading column of update_sensors
+ABERRANT_VALUES = np.array([
+    [-50, 100],  # temperature
+    [0, 100],  # air humidity
+    [0, 100],  # soil humidity
+    [800, 1200],  # pressure, hPa out of normal range
+    [0, 500],  # rain, mm extreme
+    [0, 100],  # wind speed, m/s extreme
+    [0, 360],  # wind direction, deg
+])
+# A new fire grid keyframe is taken once the snapshot deltas add up to 1/KEYFRAME_RATIO of the grid
+KEYFRAME_RATIO = 4
 
 class SimulationEngine:
-    def __init__(self, map):
-        self.env = Environment(map["width"], map["height"])
+    # Whether the environment precomputes the whole-grid propagation terms
+    static_terms = True
+
+    # Fire start: exponential decay with burnt fraction
+    fire_start_base_prob = 0.05
+    fire_start_decay_k = 6.0
+
+    # Regrowth: probability increases with burnt age
+    min_burnt_steps = 40
+    base_regrow_prob = 0.01  # base probability per green neighbor
+    max_regrow_multiplier = 5.0  # cap scaling to avoid excessive regrowth
+
+    def __init__(self, map, vectorized=True, seed=None, compact=False, env=None):
+        # vectorized=False keeps the original per-cell loop as a reference implementation
+        self.vectorized = vectorized
+        # Every random draw of the simulation goes through this generator (seed may also be a Generator)
+        self.rng = np.random.default_rng(seed)
+        # compact=True stores the grids as int8 / float32 (see Environment),
+        # env is an existing environment over the same map (e.g. resumed from a checkpoint)
+        if env is None:
+            env = Environment(map["width"], map["height"], static_terms=self.static_terms, rng=self.rng, compact=compact)
+        self.env = env
 
         self.x_unit = (map["bbox"][2] - map["bbox"][0]) / map["width"]
         self.y_unit = (map["bbox"][3] - map["bbox"][1]) / map["height"]
 
-        self.sensors = [
-            Sensor(
-                id=s["device_id"],
-                x=int((s["location"]["longitude"] - map["bbox"][0]) / self.x_unit),
-                y=int((s["location"]["latitude"] - map["bbox"][1]) / self.y_unit),
-            )
-            for s in map["sensors"]
-        ]
+        # Positions and latest readings of every station, one array per column
+        self.sensors = SensorRegistry.from_map(map)
+
+        self._build_sensor_windows()
 
         print(f"Initialized simulation of size {self.env.x_size}x{self.env.y_size} with {len(self.sensors)} sensors.")
 
@@ -29,131 +63,123 @@ class SimulationEngine:
         self.burnt_age_grid = np.zeros((self.env.y_size, self.env.x_size), dtype=np.int32)
         self.fire_start_margin = 15  # margin from edge for random fire start
 
+        # Bumped whenever fire_grid changes, the satellite view is only re-encoded then
+        self.fire_generation = 0
+        # Flat cells changed since the previous snapshot; a None log makes the next snapshot a keyframe
+        self.fire_changes = []
+        self.fire_log = None
+        self.satellite = SatelliteRenderer()
+        self.satellite_feed = SatelliteFeedEncoder(map["bbox"])
+
+        # Cumulated seconds per step phase, only recorded once enable_timings() was called
+        self.timings = None
+
         self.update_sensors()
 
+        # Latest published state, replaced as a whole after every step
+        self.snapshot = None
+        self.publish_snapshot()
+
     def start_fire(self):
-        x = random.randint(self.fire_start_margin, self.env.x_size - 1 - self.fire_start_margin)
-        y = random.randint(self.fire_start_margin, self.env.y_size - 1 - self.fire_start_margin)
+        x = int(self.rng.integers(self.fire_start_margin, self.env.x_size - self.fire_start_margin))
+        y = int(self.rng.integers(self.fire_start_margin, self.env.y_size - self.fire_start_margin))
         print(f"Randomly starting fire at ({x}, {y})")
         self.env.fire_grid[y, x] = 1
+        self.fire_generation += 1
+        self.fire_changes.append(np.array([y * self.env.x_size + x]))
 
-    def update_sensors(self):
-        r = 2
-        ABERRANT_PROB = 0.05  # 5% chance
-        for s in self.sensors:
-            y_min = max(0, s.y - r)
-            y_max = min(self.env.y_size, s.y + r + 1)
-            x_min = max(0, s.x - r)
-            x_max = min(self.env.x_size, s.x + r + 1)
-
-            local_temps = self.env.temp_map[y_min:y_max, x_min:x_max]
-            temp = np.max(local_temps)
-            air_hum = np.mean(self.env.air_hum_map[y_min:y_max, x_min:x_max])
-            soil_hum = np.mean(self.env.soil_hum_map[y_min:y_max, x_min:x_max])
-            pressure = np.mean(self.env.pressure_map[y_min:y_max, x_min:x_max])
-            rain = np.mean(self.env.rain_map[y_min:y_max, x_min:x_max])
-            wind_s = np.mean(self.env.wind_speed_map[y_min:y_max, x_min:x_max])
-            wind_d = self.env.wind_dir_map[s.y, s.x]
-
-            # Inject aberrant values randomly
-            if random.random() < ABERRANT_PROB:
-                temp = random.choice([-50, 100])  # Extreme temp
-            if random.random() < ABERRANT_PROB:
-                air_hum = random.choice([0, 100])  # Extreme humidity
-            if random.random() < ABERRANT_PROB:
-                soil_hum = random.choice([0, 100])
-            if random.random() < ABERRANT_PROB:
-                pressure = random.choice([800, 1200])  # hPa, out of normal range
-            if random.random() < ABERRANT_PROB:
-                rain = random.choice([0, 500])  # mm, extreme
-            if random.random() < ABERRANT_PROB:
-                wind_s = random.choice([0, 100])  # m/s, extreme
-            if random.random() < ABERRANT_PROB:
-                wind_d = random.choice([0, 360])  # deg, random
-
-            s.read_temp = temp
-            s.read_air_hum = air_hum
-            s.read_soil_hum = soil_hum
-            s.read_pressure = pressure
-            s.read_rain = rain
-            s.read_wind_s = wind_s
-            s.read_wind_d = wind_d
-
-    def generate_sensor_payloads(self):
-        payloads = []
-        now = datetime.datetime.now()
-        battery = 3.6
-
-        for s in self.sensors:
-            payload = {
-                "metadata": {
-                    "device_id": s.id,
-                    "timestamp": now.timestamp(),
-                    "battery_voltage": battery,
-                    "statut_bits": 0,
-                },
-                "temperature": s.read_temp,
-                "air_humidity": s.read_air_hum,
-                "soil_humidity": s.read_soil_hum,
-                "air_pressure": s.read_pressure,
-                "rain": s.read_rain,
-                "wind_speed": s.read_wind_s,
-                "wind_direction": s.read_wind_d,
-            }
-            payloads.append(payload)
-        return payloads
-    
-    def generate_satellite_payload(self, downscale_factor=1):
-        # Map values to colors: -1=black, 0=green, 1=red
-        color_map = {
-            -1: [0, 0, 0],       # black
-             0: [34, 139, 34],   # forest green
-             1: [255, 0, 0],     # red
-        }
-        grid = self.env.fire_grid
-        rgb_array = np.zeros((*grid.shape, 3), dtype=np.uint8)
-        for val, color in color_map.items():
-            rgb_array[grid == val] = color
+    def _build_sensor_windows(self):
+        # Flat indices of the (2r+1)x(2r+1) window around each sensor, clipped at the map edges
+        rows, cols = self.env.fire_grid.shape
+        offsets = np.arange(-SENSOR_RADIUS, SENSOR_RADIUS + 1)
+        sy, sx = self.sensors.y, self.sensors.x
+        wy = (sy[:, None, None] + offsets[None, :, None]).repeat(len(offsets), axis=2).reshape(len(sy), -1)
+        wx = (sx[:, None, None] + offsets[None, None, :]).repeat(len(offsets), axis=1).reshape(len(sx), -1)
+        self.sensor_window_mask = (wy >= 0) & (wy < rows) & (wx >= 0) & (wx < cols)
+        self.sensor_windows = np.where(self.sensor_window_mask, wy * cols + wx, 0)
+        self.sensor_window_sizes = self.sensor_window_mask.sum(axis=1)
+        self.sensor_cells = sy * cols + sx
+        # Published wind is averaged over the sensor cells, kept up to date by every engine
+        self.wind_cells = self.sensor_cells if len(self.sensor_cells) else np.arange(rows * cols)
 
-        # Apply Gaussian blur to each channel
-        blurred = np.zeros_like(rgb_array)
-        for i in range(3):
-            blurred[..., i] = scipy.ndimage.gaussian_filter(rgb_array[..., i], sigma=1)
+    def _window_mean(self, grid):
+        return np.where(self.sensor_window_mask, grid.take(self.sensor_windows), 0).sum(axis=1) / self.sensor_window_sizes
 
-        # Downsample the blurred image
-        small_rgb = blurred[::downscale_factor, ::downscale_factor, :]
+    def update_sensors(self):
+        env = self.env
+        readings = np.column_stack([
+            np.where(self.sensor_window_mask, env.temp_map.take(self.sensor_windows), -np.inf).max(axis=1),
+            self._window_mean(env.air_hum_map),
+            self._window_mean(env.soil_hum_map),
+            self._window_mean(env.pressure_map),
+            self._window_mean(env.rain_map),
+            self._window_mean(env.wind_speed_map),
+            env.wind_dir_map.take(self.sensor_cells),
+        ])
 
-        # Flip vertically to correct y-axis inversion
-        small_rgb = np.flipud(small_rgb)
+        # Inject aberrant values randomly, one draw per reading for all sensors at once
+        aberrant = self.rng.random(readings.shape) < ABERRANT_PROB
+        extreme = np.take_along_axis(
+            np.broadcast_to(ABERRANT_VALUES, (len(readings), *ABERRANT_VALUES.shape)),
+            self.rng.integers(0, 2, readings.shape)[:, :, None],
+            axis=2,
+        )[:, :, 0]
+        np.copyto(self.sensors.readings, np.where(aberrant, extreme, readings))
 
-        # Convert to PIL Image
-        img = Image.fromarray(small_rgb, mode='RGB')
+    def publish_snapshot(self):
+        previous = self.snapshot
+        grid = self.env.fire_grid
+        log = self.fire_log
+        if log is None or log.changed * KEYFRAME_RATIO > grid.size:
+            # Amortized: one whole-grid copy per grid.size / KEYFRAME_RATIO changed cells
+            log = self.fire_log = FireGridLog(grid)
+        elif self.fire_changes:
+            cells = np.unique(np.concatenate(self.fire_changes))
+            log.append(cells, grid.take(cells))
+        self.fire_changes = []
+        # A single attribute assignment: readers see either the old or the new snapshot
+        self.snapshot = Snapshot(
+            version=0 if previous is None else previous.version + 1,
+            timestamp=time.time(),
+            fire_generation=self.fire_generation,
+            fire_log=log,
+            fire_position=len(log.deltas),
+            sensors=self.sensors.frozen(),
+            wind_speed=float(self.env.wind_speed_map.take(self.wind_cells).mean()),
+            wind_direction=float(self.env.wind_dir_map.take(self.wind_cells).mean()),
+        )
 
-        # Encode as JPEG bytes
-        buf = io.BytesIO()
-        img.save(buf, format='JPEG')
-        return buf.getvalue()
+    def checkpoint_state(self):
+        # Engine state besides the environment grids and the generator: (arrays, scalars)
+        arrays = {"burnt_age_grid": self.burnt_age_grid, "sensor_readings": self.sensors.readings}
+        return arrays, {"fire_generation": self.fire_generation}
 
-    def step(self):
-        self.env.evolve_wind()
+    def restore_checkpoint_state(self, arrays, scalars):
+        self.burnt_age_grid = arrays["burnt_age_grid"]
+        self.sensors.readings[...] = arrays["sensor_readings"]
+        self.fire_generation = scalars["fire_generation"]
 
-        # Fire start logic: exponential decay with burnt fraction
-        total_cells = self.env.x_size * self.env.y_size
-        burnt_cells = np.count_nonzero(self.env.fire_grid == -1)
-        burnt_fraction = burnt_cells / total_cells
+    def generate_sensor_records(self, timestamp=None):
+        # One structured record per sensor (sensor.PAYLOAD_DTYPE), built in bulk
+        # timestamp lets headless runs drive a simulated clock
+        now = datetime.datetime.now().timestamp() if timestamp is None else timestamp
+        return self.sensors.records(now)
 
-        base_prob = 0.05
-        decay_k = 6.0
-        fire_start_prob = base_prob * np.exp(-decay_k * burnt_fraction)
+    def generate_sensor_payloads(self, timestamp=None):
+        # Dict view of generate_sensor_records, as published to the broker
+        now = datetime.datetime.now().timestamp() if timestamp is None else timestamp
+        return self.sensors.payloads(now)
+    
+    def generate_satellite_payload(self, downscale_factor=1):
+        # JPEG bytes, cached until the fire grid changes
+        return self.satellite.render(self.env.fire_grid, self.fire_generation, downscale_factor)
 
-        if random.random() < fire_start_prob:
-            self.start_fire()
+    def generate_satellite_frame(self):
+        # Compact state frame (keyframe or delta) of the satellite feed
+        return self.satellite_feed.encode(self.env.fire_grid)
 
+    def _spread_loop(self):
         new_fire = self.env.fire_grid.copy()
-        # Update burnt_age_grid: increment where burnt, reset elsewhere
-        self.burnt_age_grid[self.env.fire_grid == -1] += 1
-        self.burnt_age_grid[self.env.fire_grid != -1] = 0
-
         rows, cols = np.where(self.env.fire_grid == 1)
         for r, c in zip(rows, cols):
             new_fire[r, c] = -1
@@ -165,14 +191,16 @@ class SimulationEngine:
                     if 0 <= nr < self.env.y_size and 0 <= nc < self.env.x_size:
                         if self.env.fire_grid[nr, nc] == 0:
                             prob = self.env.get_probability(r, c, nr, nc)
-                            if random.random() < prob:
+                            if self.rng.random() < prob:
                                 new_fire[nr, nc] = 1
+        return new_fire
+
+    def _spread_vectorized(self, key):
+        rand = random_field(key, STREAM_SPREAD, self.env.fire_grid.shape, out=self.env.random_buffer)
+        return spread_fire(self.env.fire_grid, self.env.get_direction_probability, rand)
 
-        # Regrowth logic: regrow probability increases with burnt age
-        min_burnt_steps = 40
-        base_regrow_prob = 0.01  # base probability per green neighbor
-        max_regrow_multiplier = 5.0  # cap scaling to avoid excessive regrowth
-        burnt_rows, burnt_cols = np.where((self.env.fire_grid == -1) & (self.burnt_age_grid >= min_burnt_steps))
+    def _regrow_loop(self, new_fire):
+        burnt_rows, burnt_cols = np.where((self.env.fire_grid == -1) & (self.burnt_age_grid >= self.min_burnt_steps))
         for r, c in zip(burnt_rows, burnt_cols):
             green_neighbors = 0
             for dr in [-1, 0, 1]:
@@ -186,13 +214,77 @@ class SimulationEngine:
             if green_neighbors > 0:
                 # Linear scaling: every 40 steps increases multiplier by 1, capped
                 age = self.burnt_age_grid[r, c]
-                regrow_multiplier = min(max_regrow_multiplier, age / min_burnt_steps)
-                regrow_prob = base_regrow_prob * green_neighbors * regrow_multiplier
-                if random.random() < regrow_prob:
+                regrow_multiplier = min(self.max_regrow_multiplier, age / self.min_burnt_steps)
+                regrow_prob = self.base_regrow_prob * green_neighbors * regrow_multiplier
+                if self.rng.random() < regrow_prob:
                     new_fire[r, c] = 0
                     self.burnt_age_grid[r, c] = 0  # Reset age on regrow
 
+    def _regrow_vectorized(self, new_fire, key):
+        rand = random_field(key, STREAM_REGROW, self.env.fire_grid.shape, out=self.env.random_buffer)
+        regrow(
+            self.env.fire_grid,
+            new_fire,
+            self.burnt_age_grid,
+            rand,
+            self.min_burnt_steps,
+            self.base_regrow_prob,
+            self.max_regrow_multiplier,
+        )
+
+    def enable_timings(self):
+        self.timings = defaultdict(float)
+
+    @contextmanager
+    def timed(self, phase):
+        if self.timings is None:
+            yield
+            return
+        start = time.perf_counter()
+        yield
+        self.timings[phase] += time.perf_counter() - start
+
+    def next_step_key(self):
+        # Seeds every per-cell random field of a step (see spread.random_field)
+        return self.rng.integers(0, 2**62)
+
+    @classmethod
+    def fire_start_probability(cls, burnt_fraction):
+        return cls.fire_start_base_prob * np.exp(-cls.fire_start_decay_k * burnt_fraction)
+
+    def step(self):
+        key = self.next_step_key()
+        with self.timed("wind"):
+            self.env.evolve_wind(key)
+
+        total_cells = self.env.x_size * self.env.y_size
+        burnt_cells = np.count_nonzero(self.env.fire_grid == -1)
+        burnt_fraction = burnt_cells / total_cells
+
+        if self.rng.random() < self.fire_start_probability(burnt_fraction):
+            self.start_fire()
+
+        # Update burnt_age_grid: increment where burnt, reset elsewhere
+        self.burnt_age_grid[self.env.fire_grid == -1] += 1
+        self.burnt_age_grid[self.env.fire_grid != -1] = 0
+
+        with self.timed("spread"):
+            new_fire = self._spread_vectorized(key) if self.vectorized else self._spread_loop()
+        with self.timed("regrowth"):
+            if self.vectorized:
+                self._regrow_vectorized(new_fire, key)
+            else:
+                self._regrow_loop(new_fire)
+
+        changed = np.flatnonzero(new_fire != self.env.fire_grid)
+        if len(changed):
+            self.fire_generation += 1
+            self.fire_changes.append(changed)
         self.env.fire_grid = new_fire
 
-        self.env.apply_heat_from_fire()
-        self.update_sensors()
+        with self.timed("heat"):
+            self.env.apply_heat_from_fire()
+        with self.timed("sensors"):
+            self.update_sensors()
+        with self.timed("snapshot"):
+            self.publish_snapshot()
@@ -0,0 +1,97 @@
+import numpy as np
+from engine import SimulationEngine
+from environment import Environment
+from spread import regrow, spread_fire
+
+# Maps each member evolves on its own (fire heats them, wind walks randomly)
+MEMBER_MAPS = ["temp_map", "air_hum_map", "soil_hum_map", "wind_speed_map", "wind_dir_map", "wind_u", "wind_v"]
+
+
+class EnsembleSimulation:
+    """
+    N independent simulations of the same map stepped as one batched array
+    computation. Every evolving grid carries a leading ensemble axis, the
+    terrain and its static propagation terms are shared by all members.
+    """
+
+    def __init__(self, map, members, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.members = members
+        self.fire_start_margin = 15  # margin from edge for random fire start
+
+        base = Environment(map["width"], map["height"], rng=self.rng)
+        self.env = Environment.from_arrays(
+            {name: np.repeat(getattr(base, name)[None], members, axis=0) for name in MEMBER_MAPS}
+            | {"altitude_map": base.altitude_map, "fire_grid": np.zeros((members, *base.fire_grid.shape))},
+            rng=self.rng,
+        )
+        self.shape = self.env.fire_grid.shape
+        self.burnt_age_grid = np.zeros(self.shape, dtype=np.int32)
+        # Cells that have been on fire at least once, per member
+        self.ever_burnt = np.zeros(self.shape, dtype=bool)
+        self.step_count = 0
+
+    def ignite(self, x, y):
+        # Same ignition point in every member
+        self.env.fire_grid[:, y, x] = 1
+        self.ever_burnt[:, y, x] = True
+
+    def _evolve_wind(self):
+        env = self.env
+        env.wind_dir_map += self.rng.uniform(-2, 2, self.shape)
+        np.mod(env.wind_dir_map, 360, out=env.wind_dir_map)
+        env.wind_speed_map += self.rng.uniform(-1, 1, self.shape)
+        np.clip(env.wind_speed_map, 0, 100, out=env.wind_speed_map)
+        env.update_wind_terms()
+
+    def _start_fires(self):
+        fire_grid = self.env.fire_grid
+        burnt_fraction = np.count_nonzero(fire_grid == -1, axis=(1, 2)) / (self.env.x_size * self.env.y_size)
+        starting = np.flatnonzero(self.rng.random(self.members) < SimulationEngine.fire_start_probability(burnt_fraction))
+        x = self.rng.integers(self.fire_start_margin, self.env.x_size - self.fire_start_margin, len(starting))
+        y = self.rng.integers(self.fire_start_margin, self.env.y_size - self.fire_start_margin, len(starting))
+        fire_grid[starting, y, x] = 1
+        # Counted now, spreading turns them to burnt before the end of the step
+        self.ever_burnt[starting, y, x] = True
+
+    def _apply_heat(self):
+        env = self.env
+        burning = env.fire_grid == 1
+        heat = self.rng.uniform([60, 5, 5], [70, 45, 40], (self.members, 3))[:, :, None, None]
+        for i, (name, high) in enumerate([("temp_map", 800), ("air_hum_map", 100), ("soil_hum_map", 100)]):
+            grid = getattr(env, name)
+            np.copyto(grid, heat[:, i], where=burning)
+            np.clip(grid, -20 if name == "temp_map" else 0, high, out=grid)
+
+    def step(self):
+        env = self.env
+        self._evolve_wind()
+        self._start_fires()
+
+        self.burnt_age_grid[env.fire_grid == -1] += 1
+        self.burnt_age_grid[env.fire_grid != -1] = 0
+
+        new_fire = spread_fire(env.fire_grid, env.get_direction_probability, self.rng.random(self.shape))
+        regrow(
+            env.fire_grid,
+            new_fire,
+            self.burnt_age_grid,
+            self.rng.random(self.shape),
+            SimulationEngine.min_burnt_steps,
+            SimulationEngine.base_regrow_prob,
+            SimulationEngine.max_regrow_multiplier,
+        )
+        env.fire_grid = new_fire
+        self.ever_burnt |= new_fire == 1
+
+        self._apply_heat()
+        self.step_count += 1
+
+    def run(self, steps):
+        for _ in range(steps):
+            self.step()
+        return self.burn_probability()
+
+    def burn_probability(self):
+        # Per-cell fraction of members in which the cell has burnt
+        return self.ever_burnt.mean(axis=0)
@@ -1,42 +1,128 @@
 import numpy as np
 import scipy.ndimage
+from spread import (
+    NEIGHBOURS,
+    STREAM_WIND_DIR,
+    STREAM_WIND_SPEED,
+    ignition_probability,
+    neighbour_slices,
+    random_field,
+    slope_term,
+)
 
 class Environment:
-    def __init__(self, x_size=50, y_size=50):
+    def __init__(self, x_size=50, y_size=50, static_terms=True, rng=None, compact=False):
         self.x_size = x_size
         self.y_size = y_size
+        self.rng = np.random.default_rng(rng)
+        # Position of this environment in the whole simulated grid (tiles are windows of it)
+        self.origin = (0, 0)
+        self.grid_shape = (y_size, x_size)
+        # Compact mode: int8 fire state and float32 physical fields
+        self.field_dtype = np.float32 if compact else np.float64
 
         self.altitude_map = self._generate_smooth_map(100, 500, sigma=3)
         self.temp_map = self._generate_smooth_map(20, 30, sigma=5)
         self.air_hum_map = self._generate_smooth_map(20, 60, sigma=4)
         self.soil_hum_map = self._generate_smooth_map(15, 50, sigma=4)
         self.pressure_map = 1013.0 - (self.altitude_map / 8.3)
-        self.rain_map = np.zeros((x_size, y_size))
+        self.rain_map = np.zeros((y_size, x_size), dtype=self.field_dtype)
 
-        self.wind_speed_map = np.full((x_size, y_size), 30.0)
-        self.wind_dir_map = np.full((x_size, y_size), 135.0) #nord-est
+        self.wind_speed_map = np.full((y_size, x_size), 30.0, dtype=self.field_dtype)
+        self.wind_dir_map = np.full((y_size, x_size), 135.0, dtype=self.field_dtype) #nord-est
 
-        self.fire_grid = np.zeros((x_size, y_size))
+        self.fire_grid = np.zeros((y_size, x_size), dtype=np.int8 if compact else np.float64)
+
+        self._init_propagation_terms(static_terms)
+
+    @classmethod
+    def from_arrays(cls, maps, origin=(0, 0), grid_shape=None, static_terms=True, rng=None):
+        """
+        Build an environment over existing arrays (e.g. shared memory views of
+        a tile, or maps with a leading ensemble axis) instead of generating new
+        maps. `maps` must hold the fire grid, the wind maps and whatever maps
+        the caller will read.
+        """
+        env = cls.__new__(cls)
+        for name, array in maps.items():
+            setattr(env, name, array)
+        env.y_size, env.x_size = env.fire_grid.shape[-2:]
+        env.rng = np.random.default_rng(rng)
+        env.origin = origin
+        env.grid_shape = grid_shape or env.fire_grid.shape[-2:]
+        env.field_dtype = env.wind_speed_map.dtype.type
+        env._init_propagation_terms(static_terms)
+        return env
+
+    def _init_propagation_terms(self, static_terms):
+        # Static propagation terms: the terrain and the 8 directions never change.
+        # The per-direction slope arrays cost 8 full grids, sparse engines skip them.
+        self.direction_vectors = {}
+        self.slope_terms = {}
+        for dr, dc in NEIGHBOURS:
+            angle = np.arctan2(dr, dc)
+            self.direction_vectors[(dr, dc)] = (np.cos(angle), np.sin(angle))
+            if static_terms:
+                dst, src = neighbour_slices(dr, dc)
+                self.slope_terms[(dr, dc)] = slope_term(self.altitude_map[src], self.altitude_map[dst])
+
+        # Per-step scratch buffers, so that stepping allocates no full-size grid
+        self.random_buffer = np.empty(self.wind_speed_map.shape)
+        self.field_buffers = (np.empty_like(self.wind_speed_map), np.empty_like(self.wind_speed_map))
+        self.fire_mask = np.empty(self.fire_grid.shape, dtype=bool)
+
+        if not hasattr(self, "wind_u"):
+            self.wind_u = np.empty_like(self.wind_speed_map)
+            self.wind_v = np.empty_like(self.wind_speed_map)
+            self.update_wind_terms()
 
     def _generate_smooth_map(self, low, high, sigma):
-        raw = np.random.uniform(low, high, (self.x_size, self.y_size))
-        return scipy.ndimage.gaussian_filter(raw, sigma=sigma)
+        raw = self.rng.uniform(low, high, (self.y_size, self.x_size))
+        return scipy.ndimage.gaussian_filter(raw, sigma=sigma).astype(self.field_dtype, copy=False)
 
-    def evolve_wind(self):
-        delta_dir = np.random.uniform(-2, 2, (self.x_size, self.y_size))
-        self.wind_dir_map = (self.wind_dir_map + delta_dir) % 360
+    def evolve_wind(self, key):
+        # Wind random walk, drawn from the per-cell fields of the step key and updated in place
+        rows = (self.origin[0], self.origin[0] + self.y_size)
+        cols = (self.origin[1], self.origin[1] + self.x_size)
+        delta = random_field(key, STREAM_WIND_DIR, self.grid_shape, rows, cols, out=self.random_buffer)
+        delta *= 4.0
+        delta -= 2.0
+        np.add(self.wind_dir_map, delta, out=self.wind_dir_map, casting="same_kind")
+        np.mod(self.wind_dir_map, 360, out=self.wind_dir_map)
 
-        delta_speed = np.random.uniform(-1, 1, (self.x_size, self.y_size))
-        self.wind_speed_map = np.clip(self.wind_speed_map + delta_speed, 0, 100)
+        delta = random_field(key, STREAM_WIND_SPEED, self.grid_shape, rows, cols, out=self.random_buffer)
+        delta *= 2.0
+        delta -= 1.0
+        np.add(self.wind_speed_map, delta, out=self.wind_speed_map, casting="same_kind")
+        np.clip(self.wind_speed_map, 0, 100, out=self.wind_speed_map)
+        self.update_wind_terms()
 
-    def apply_heat_from_fire(self):
-        fire_mask = (self.fire_grid == 1)
-        self.temp_map[fire_mask] = np.random.uniform(60, 70, 1)[0]
-        self.temp_map = np.clip(self.temp_map, -20, 800)
-        self.air_hum_map[fire_mask] = np.random.uniform(5, 45, 1)[0]
-        self.air_hum_map = np.clip(self.air_hum_map, 0, 100)
-        self.soil_hum_map[fire_mask] = np.random.uniform(5, 40, 1)[0]
-        self.soil_hum_map = np.clip(self.soil_hum_map, 0, 100)
+    def update_wind_terms(self):
+        # Wind vector scaled so that its dot product with a direction vector
+        # gives (W_s / 50) * cos(W_d - angle_target)
+        speed, angle = self.field_buffers
+        np.divide(self.wind_speed_map, 50.0, out=speed)
+        np.cos(np.radians(self.wind_dir_map, out=angle), out=angle)
+        np.multiply(speed, angle, out=self.wind_u)
+        np.sin(np.radians(self.wind_dir_map, out=angle), out=angle)
+        np.multiply(speed, angle, out=self.wind_v)
+
+    def draw_heat(self):
+        return (
+            self.rng.uniform(60, 70, 1)[0],
+            self.rng.uniform(5, 45, 1)[0],
+            self.rng.uniform(5, 40, 1)[0],
+        )
+
+    def apply_heat_from_fire(self, heat=None):
+        temp, air_hum, soil_hum = heat if heat is not None else self.draw_heat()
+        fire_mask = np.equal(self.fire_grid, 1, out=self.fire_mask)
+        np.copyto(self.temp_map, temp, where=fire_mask)
+        np.clip(self.temp_map, -20, 800, out=self.temp_map)
+        np.copyto(self.air_hum_map, air_hum, where=fire_mask)
+        np.clip(self.air_hum_map, 0, 100, out=self.air_hum_map)
+        np.copyto(self.soil_hum_map, soil_hum, where=fire_mask)
+        np.clip(self.soil_hum_map, 0, 100, out=self.soil_hum_map)
 
     def get_probability(self, r1, c1, r2, c2):
         T = self.temp_map[r2, c2]
@@ -56,3 +142,17 @@ class Environment:
         wind_factor = (W_s / 50.0) * wind_alignment if W_s > 0 else 0
 
         return max(0.0, min(1.0, base_prob + slope + wind_factor))
+
+    def get_direction_probability(self, dr, dc):
+        # Whole-grid counterpart of get_probability for every source -> target pair along (dr, dc)
+        dst, _ = neighbour_slices(dr, dc)
+        ux, uy = self.direction_vectors[(dr, dc)]
+        wind_factor = self.wind_u[dst] * ux + self.wind_v[dst] * uy
+        return ignition_probability(self.temp_map[dst], self.air_hum_map[dst], self.slope_terms[(dr, dc)], wind_factor)
+
+    def get_cells_probability(self, src, dst, dr, dc):
+        # Sparse counterpart of get_direction_probability for flat cell indices along (dr, dc)
+        slope = slope_term(self.altitude_map.take(src), self.altitude_map.take(dst))
+        ux, uy = self.direction_vectors[(dr, dc)]
+        wind_factor = self.wind_u.take(dst) * ux + self.wind_v.take(dst) * uy
+        return ignition_probability(self.temp_map.take(dst), self.air_hum_map.take(dst), slope, wind_factor)
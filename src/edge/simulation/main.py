@@ -1,16 +1,23 @@
 import os
 import asyncio
 from sys import stdout
-from threading import Thread, Event, Lock
+from threading import Thread, Event
 import numpy as np
 import paho.mqtt.client as mqtt
 from engine import SimulationEngine
+from sparse_engine import SparseSimulationEngine
+from tiled_engine import TiledSimulationEngine
+from satellite import SatelliteRenderer
+from publisher import SensorPublisher
+from checkpoint import load_checkpoint, save_checkpoint
 import geojson
 import random
 import json
 from io import BytesIO
 from minio import Minio
 from minio.error import S3Error
+import urllib3
+from registry import StationRegistrySync
 import base64
 
 MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
@@ -24,17 +31,48 @@ MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "localhost:9000")
 MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "minioadmin")
 MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "minioadmin123")
 MINIO_BUCKET = os.getenv("MINIO_BUCKET", "stations")
+# Station registry: objects ({device_id}.json, read by the pre-treatment), consolidated (one object + index) or both
+STATION_REGISTRY = os.getenv("STATION_REGISTRY", "objects").lower()
+MINIO_UPLOAD_WORKERS = int(os.getenv("MINIO_UPLOAD_WORKERS", "16"))
 
 START_MARGIN = 15
 
+GRID_WIDTH = int(os.getenv("GRID_WIDTH", "64"))
+GRID_HEIGHT = int(os.getenv("GRID_HEIGHT", "64"))
+
+# vectorized (default), sparse (active front only, for very large maps),
+# tiled (multi-core, for high-resolution maps) or loop (reference)
+SIM_MODE = os.getenv("SIM_MODE", "vectorized").lower()
+SIM_WORKERS = int(os.getenv("SIM_WORKERS", str(os.cpu_count())))
+SIM_TILE_SIZE = int(os.getenv("SIM_TILE_SIZE", "256"))
+SIM_SEED = int(os.getenv("SIM_SEED")) if os.getenv("SIM_SEED") else None
+# int8 fire state and float32 fields, for large maps
+SIM_COMPACT = os.getenv("SIM_COMPACT", "false").lower() in ("1", "true", "yes")
+
+# Satellite feed: jpeg (base64 JPEG in JSON), compact (bit-packed state frames) or both
+SATELLITE_FORMAT = os.getenv("SATELLITE_FORMAT", "jpeg").lower()
+SATELLITE_KEYFRAME_INTERVAL = int(os.getenv("SATELLITE_KEYFRAME_INTERVAL", "10"))
+
+# Sensor payloads: one message per sensor (single) or one JSON array per step on sensors/meteo/batch (batch)
+PUBLISH_MODE = os.getenv("PUBLISH_MODE", "single").lower()
+# Batch mode: split each step over sensors/meteo/batch/<slot> by crc32(device_id) % BATCH_SLOTS
+# (0: one message), set to the SHARD_SLOTS of a sharded pre-treatment
+BATCH_SLOTS = int(os.getenv("BATCH_SLOTS", "0"))
+# Encoded steps waiting for the sender thread, the oldest is dropped beyond this
+PUBLISH_QUEUE_SIZE = int(os.getenv("PUBLISH_QUEUE_SIZE", "4"))
+
+# Checkpoint directory (empty: no checkpoints), written every CHECKPOINT_INTERVAL steps and resumed at startup
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR", "")
+CHECKPOINT_INTERVAL = int(os.getenv("CHECKPOINT_INTERVAL", "100"))
+
 def parse_geojson(file_path):
     try:
         with open(file_path, "r") as f:
             geojson_data = geojson.load(f)
         data = {
             "bbox": geojson_data.bbox,
-            "width": 64,
-            "height": 64,
+            "width": GRID_WIDTH,
+            "height": GRID_HEIGHT,
             "sensors": [],
         }
 
@@ -58,33 +96,6 @@ def parse_geojson(file_path):
         return None
 
 
-def upload_station_to_minio(minio_client, station):
-    try:
-        object_name = f"{station['device_id']}.json"
-        data_bytes = json.dumps(station).encode("utf-8")
-        minio_client.put_object(
-            bucket_name=MINIO_BUCKET,
-            object_name=object_name,
-            data=BytesIO(data_bytes),
-            length=len(data_bytes),
-            content_type="application/octet-stream",
-        )
-        print(f"Uploaded {MINIO_BUCKET}/{object_name} to MinIO")
-    except Exception as e:
-        print(f"Failed to upload to MinIO: {e}")
-
-
-client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
-
-try:
-    print(f"Connecting to MQTT broker at '{MQTT_BROKER}'...")
-    client.connect(MQTT_BROKER, MQTT_PORT, KEEP_ALIVE)
-    client.loop_start()
-    print("Connected successfully!")
-except Exception as e:
-    print(f"Failed to connect to MQTT broker: {e}")
-    exit()
-
 GEOJSON_FILE = os.getenv("GEOJSON_FILE", "map.geojson")
 map = parse_geojson(GEOJSON_FILE)
 if map is None:
@@ -97,6 +108,12 @@ if MINIO:
             access_key=MINIO_ACCESS_KEY,
             secret_key=MINIO_SECRET_KEY,
             secure=False,
+            # One connection per upload worker, shared by all of them
+            http_client=urllib3.PoolManager(
+                maxsize=MINIO_UPLOAD_WORKERS,
+                timeout=urllib3.Timeout(connect=10, read=60),
+                retries=urllib3.Retry(total=3, backoff_factor=0.2, status_forcelist=[500, 502, 503, 504]),
+            ),
         )
         print(f"Connected to MinIO at '{MINIO_ENDPOINT}'")
 
@@ -105,29 +122,76 @@ if MINIO:
             minio_client.make_bucket(MINIO_BUCKET)
             print(f"Created bucket '{MINIO_BUCKET}'")
 
-        for station in map["sensors"]:
-            upload_station_to_minio(minio_client, station)
+        StationRegistrySync(minio_client, MINIO_BUCKET, workers=MINIO_UPLOAD_WORKERS).sync(
+            map["sensors"],
+            objects=STATION_REGISTRY != "consolidated",
+            consolidated=STATION_REGISTRY != "objects",
+        )
     except S3Error as e:
         print(f"Failed to connect to MinIO: {e}")
         exit(1)
 
-sim = SimulationEngine(map)
+if SIM_MODE == "sparse":
+    engine_cls, engine_kwargs = SparseSimulationEngine, {}
+elif SIM_MODE == "tiled":
+    engine_cls, engine_kwargs = TiledSimulationEngine, {"tile_size": SIM_TILE_SIZE, "workers": SIM_WORKERS}
+else:
+    engine_cls, engine_kwargs = SimulationEngine, {"vectorized": SIM_MODE != "loop"}
+
+sim = None
+if CHECKPOINT_DIR:
+    try:
+        sim = load_checkpoint(CHECKPOINT_DIR, map, engine_cls, **engine_kwargs)
+    except FileNotFoundError:
+        print(f"No checkpoint in {CHECKPOINT_DIR}, starting a new simulation")
+    except ValueError as e:
+        print(f"Ignoring checkpoint in {CHECKPOINT_DIR}: {e}")
+if sim is None:
+    sim = engine_cls(map, seed=SIM_SEED, compact=SIM_COMPACT, **engine_kwargs)
+
+# Connected once the engine exists: the tiled engine forks its workers before any thread starts
+client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 
-# New: shared-state lock and stop event
-env_lock = Lock()
+try:
+    print(f"Connecting to MQTT broker at '{MQTT_BROKER}'...")
+    client.connect(MQTT_BROKER, MQTT_PORT, KEEP_ALIVE)
+    client.loop_start()
+    print("Connected successfully!")
+except Exception as e:
+    print(f"Failed to connect to MQTT broker: {e}")
+    if isinstance(sim, TiledSimulationEngine):
+        sim.close()
+    exit()
+
+# Only the simulation thread touches sim; the other threads read sim.snapshot,
+# an immutable state swapped after every step
 stop_event = Event()
 
+publisher = SensorPublisher(
+    client, sim.sensors.ids.tolist(), batch=PUBLISH_MODE == "batch", queue_size=PUBLISH_QUEUE_SIZE, slots=BATCH_SLOTS
+)
+
 # --- Satellite sending thread ---
 def satellite_sender_thread(delay=5):
     step_count = 0
+    sat_payload, message = None, None
+    sim.satellite_feed.keyframe_interval = SATELLITE_KEYFRAME_INTERVAL
     while not stop_event.is_set():
-        with env_lock:
-            sat_payload = sim.generate_satellite_payload()
-        sat_topic = "sensors/satellite/view"
+        snapshot = sim.snapshot
+        jpeg = None
+        if SATELLITE_FORMAT != "compact":
+            jpeg = sim.satellite.render(snapshot.fire_grid, snapshot.fire_generation)
+        frame = sim.satellite_feed.encode(snapshot.fire_grid) if SATELLITE_FORMAT != "jpeg" else None
 
-        img_b64 = base64.b64encode(sat_payload).decode("ascii")
-        wrapper = {"bbox": map.get("bbox"), "image": img_b64}
-        client.publish(sat_topic, json.dumps(wrapper))
+        if jpeg is not None:
+            # Same bytes object while the fire grid is unchanged: reuse the encoded message
+            if jpeg is not sat_payload:
+                sat_payload = jpeg
+                img_b64 = base64.b64encode(sat_payload).decode("ascii")
+                message = json.dumps({"bbox": map.get("bbox"), "image": img_b64})
+            client.publish("sensors/satellite/view", message)
+        if frame is not None:
+            client.publish("sensors/satellite/state", frame)
 
         print("-> Satellite | Fire grid data sent (threaded)")
         step_count += 1
@@ -142,18 +206,16 @@ def start_satellite_thread(delay=5):
 async def sim_loop(max_steps=None):
     step_count = 0
     while not stop_event.is_set():
-        with env_lock:
-            sim.step()
-            payloads = sim.generate_sensor_payloads()
+        sim.step()
+        # Encoded and sent by the publisher thread while the next step runs
+        publisher.publish(sim.snapshot)
         print(f"Step {step_count}")
-        for p in payloads:
-            device_id = p["metadata"]["device_id"]
-            topic = f"sensors/meteo/{device_id}/lora"
-            client.publish(topic, json.dumps(p))
-            print(
-                f"-> {device_id} | T:{float(p['temperature']):.2f}°C | Vent:{int(p['wind_direction'])}°"
-            )
         step_count += 1
+        if CHECKPOINT_DIR and step_count % CHECKPOINT_INTERVAL == 0:
+            try:
+                save_checkpoint(sim, map, CHECKPOINT_DIR)
+            except OSError as e:
+                print(f"Failed to save checkpoint: {e}")
         if max_steps is not None and step_count >= max_steps:
             break
         stdout.flush()
@@ -164,7 +226,8 @@ def start_sim_thread():
     t.start()
     return t
 
-# Start SIM and satellite sender in background threads
+# Start SIM, sensor publisher and satellite sender in background threads
+publisher.start()
 sim_thread = start_sim_thread()
 sat_thread = start_satellite_thread(delay=5)
 
@@ -183,14 +246,15 @@ if PLOT:
             # fallback: blank image
             return np.zeros((map["height"] // 4, map["width"] // 4, 3), dtype=np.uint8)
 
+    # The satellite thread has its own renderer, buffers are not shared across threads
+    gui_renderer = SatelliteRenderer()
+
     def update_gui(frame):
-        # Safely read fire grid snapshot for display
-        with env_lock:
-            grid = sim.env.fire_grid.copy()
-            sat_payload_bytes = sim.generate_satellite_payload()
-        im_fire.set_data(grid)
+        snapshot = sim.snapshot
+        sat_payload_bytes = gui_renderer.render(snapshot.fire_grid, snapshot.fire_generation)
+        im_fire.set_data(snapshot.fire_grid)
         titre.set_text(
-            f"Vent {sim.env.wind_speed_map.mean():.1f} km/h à {sim.env.wind_dir_map.mean():.1f}°"
+            f"Vent {snapshot.wind_speed:.1f} km/h à {snapshot.wind_direction:.1f}°"
         )
         # Update satellite view
         sat_img = decode_sat_image(sat_payload_bytes)
@@ -200,14 +264,15 @@ if PLOT:
     fig, axs = plt.subplots(1, 2, figsize=(12, 6))
     cmap = ListedColormap(["black", "forestgreen", "red"])
     # Fire grid
-    im_fire = axs[0].imshow(sim.env.fire_grid, cmap=cmap, vmin=-1, vmax=1, origin="lower")
-    sx = [s.x for s in sim.sensors]
-    sy = [s.y for s in sim.sensors]
+    snapshot = sim.snapshot
+    im_fire = axs[0].imshow(snapshot.fire_grid, cmap=cmap, vmin=-1, vmax=1, origin="lower")
+    sx = snapshot.sensors.x
+    sy = snapshot.sensors.y
     axs[0].scatter(sx, sy, c="cyan", edgecolors="white", s=80)
     titre = axs[0].set_title("")
 
     # Satellite view preview
-    sat_payload_bytes = sim.generate_satellite_payload()
+    sat_payload_bytes = gui_renderer.render(snapshot.fire_grid, snapshot.fire_generation)
     sat_img = decode_sat_image(sat_payload_bytes)
     im_sat = axs[1].imshow(sat_img)
     axs[1].set_title("Satellite View")
@@ -227,6 +292,12 @@ else:
 print("Stopping simulation...")
 stop_event.set()
 sim_thread.join(timeout=5)
+if CHECKPOINT_DIR and not sim_thread.is_alive():
+    save_checkpoint(sim, map, CHECKPOINT_DIR)
 sat_thread.join(timeout=5)
+publisher.stop()
+if isinstance(sim, TiledSimulationEngine) and not sim_thread.is_alive():
+    # Still stepping: the OS reclaims the shared memory at exit instead
+    sim.close()
 client.loop_stop()
 client.disconnect()
@@ -0,0 +1,112 @@
+import json
+import queue
+import zlib
+from threading import Thread
+import numpy as np
+from sensor import READING_FIELDS
+
+# One message per step holding every sensor payload, as a JSON array
+BATCH_TOPIC = "sensors/meteo/batch"
+
+
+def batch_slot(device_id, slots):
+    # Same as the slots of the sharded treatment (sharding.slot_of)
+    return zlib.crc32(str(device_id).encode()) % slots
+
+
+def payload_template(device_id, battery=3.6):
+    # Same JSON as json.dumps(SensorRegistry.payloads(...)[i]); %s of a float is its JSON repr
+    metadata = json.dumps(device_id).replace("%", "%%")
+    fields = "".join(f', "{field}": %s' for field in READING_FIELDS)
+    return (
+        f'{{"metadata": {{"device_id": {metadata}, "timestamp": %s, '
+        f'"battery_voltage": {battery!r}, "statut_bits": 0}}{fields}}}'
+    )
+
+
+class SensorPublisher:
+    """
+    Publishes the sensor readings of each step from a dedicated sender thread.
+
+    Snapshots go through a bounded queue; when the sender falls behind, the
+    oldest pending step is dropped so that the simulation never waits on
+    encoding or on the network. A step is serialised in one pass: the JSON
+    payloads of all sensors are a single pre-built format string filled with
+    the step timestamp and the (read-only) reading matrix of the snapshot.
+    """
+
+    def __init__(self, client, sensor_ids, batch=False, queue_size=4, slots=0):
+        self.client = client
+        ids = list(sensor_ids)
+        self.sensors = len(ids)
+        # Rows of the reading matrix in message order
+        self.order = None
+        # JSON payloads never contain a raw newline, it separates the messages
+        if not batch:
+            self.topics = [f"sensors/meteo/{device_id}/lora" for device_id in ids]
+            self.template = "\n".join(payload_template(device_id) for device_id in ids)
+        elif slots:
+            # One array per slot of devices on BATCH_TOPIC/<slot>, so that a sharded
+            # treatment routes each of them to its worker without decoding it
+            groups = {}
+            for i, device_id in enumerate(ids):
+                groups.setdefault(batch_slot(device_id, slots), []).append(i)
+            self.topics = [f"{BATCH_TOPIC}/{slot}" for slot in sorted(groups)]
+            self.order = np.array([i for slot in sorted(groups) for i in groups[slot]], dtype=np.intp)
+            self.template = "\n".join(
+                "[" + ",".join(payload_template(ids[i]) for i in groups[slot]) + "]" for slot in sorted(groups)
+            )
+        else:
+            self.topics = [BATCH_TOPIC]
+            self.template = "[" + ",".join(payload_template(device_id) for device_id in ids) + "]"
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.published = 0
+        self.dropped = 0
+        self.thread = None
+
+    def encode(self, timestamp, readings):
+        """One payload per topic of self.topics."""
+        values = np.empty((len(readings), 1 + len(READING_FIELDS)))
+        values[:, 0] = timestamp
+        values[:, 1:] = readings if self.order is None else readings[self.order]
+        encoded = self.template % tuple(values.ravel().tolist())
+        return encoded.split("\n")
+
+    def publish(self, snapshot):
+        message = (snapshot.version, snapshot.timestamp, snapshot.sensors.readings)
+        while True:
+            try:
+                self.queue.put_nowait(message)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def start(self):
+        self.thread = Thread(target=self._send_loop, daemon=True)
+        self.thread.start()
+        return self.thread
+
+    def stop(self, timeout=5):
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _send_loop(self):
+        while True:
+            message = self.queue.get()
+            if message is None:
+                break
+            version, timestamp, readings = message
+            for topic, payload in zip(self.topics, self.encode(timestamp, readings)):
+                self.client.publish(topic, payload)
+            self.published += 1
+            dropped = f", {self.dropped} step(s) dropped so far" if self.dropped else ""
+            print(f"-> Step {version} | {self.sensors} sensor payloads sent{dropped}")
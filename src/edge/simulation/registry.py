@@ -0,0 +1,108 @@
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from minio.error import S3Error
+
+# Consolidated registry: one station JSON per line, and the byte range of each station
+REGISTRY_OBJECT = "registry.ndjson"
+REGISTRY_INDEX_OBJECT = "registry.index.json"
+
+
+def station_object(station):
+    # Same object the pre-treatment worker reads for each device
+    return f"{station['device_id']}.json", json.dumps(station).encode("utf-8")
+
+
+def consolidated_registry(stations):
+    lines, index, offset = [], {}, 0
+    for station in stations:
+        line = json.dumps(station).encode("utf-8") + b"\n"
+        index[str(station["device_id"])] = [offset, len(line) - 1]
+        lines.append(line)
+        offset += len(line)
+    return b"".join(lines), json.dumps({"object": REGISTRY_OBJECT, "stations": index}).encode("utf-8")
+
+
+def _etag(etag):
+    return etag.strip('"') if etag else None
+
+
+class StationRegistrySync:
+    """
+    Idempotent upload of the station registry to MinIO.
+
+    Objects whose MD5 already matches the stored ETag (single-part uploads)
+    are skipped, the stored ETags of the per-station objects come from one
+    bucket listing. Changed objects are uploaded in parallel by a bounded
+    thread pool; the Minio client and its urllib3 pool are shared, so the
+    pool should hold at least `workers` connections.
+    """
+
+    def __init__(self, minio_client, bucket, workers=16):
+        self.minio_client = minio_client
+        self.bucket = bucket
+        self.workers = workers
+
+    def _stored_etags(self):
+        return {
+            obj.object_name: _etag(obj.etag)
+            for obj in self.minio_client.list_objects(self.bucket)
+            if not obj.is_dir
+        }
+
+    def _stored_etag(self, object_name):
+        try:
+            return _etag(self.minio_client.stat_object(self.bucket, object_name).etag)
+        except S3Error as e:
+            if e.code in ("NoSuchKey", "NoSuchObject"):
+                return None
+            raise
+
+    def _put(self, object_name, data):
+        self.minio_client.put_object(
+            bucket_name=self.bucket,
+            object_name=object_name,
+            data=BytesIO(data),
+            length=len(data),
+            content_type="application/octet-stream",
+        )
+
+    def sync(self, stations, objects=True, consolidated=False):
+        """
+        Upload what changed and return (uploaded, unchanged, failed) counts.
+        objects: one {device_id}.json per station (read by the pre-treatment).
+        consolidated: the registry as a single object plus its index.
+        """
+        start = time.perf_counter()
+        pending, stored = [], {}
+        if objects:
+            # The listing also covers the consolidated objects
+            stored = self._stored_etags()
+            pending += [station_object(station) for station in stations]
+        if consolidated:
+            registry, index = consolidated_registry(stations)
+            pending += [(REGISTRY_OBJECT, registry), (REGISTRY_INDEX_OBJECT, index)]
+            if not objects:
+                # Two stats, whatever the station count
+                stored = {name: self._stored_etag(name) for name in (REGISTRY_OBJECT, REGISTRY_INDEX_OBJECT)}
+
+        changed = [(name, data) for name, data in pending if stored.get(name) != hashlib.md5(data).hexdigest()]
+        failed = 0
+        if changed:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [(name, pool.submit(self._put, name, data)) for name, data in changed]
+                for name, future in futures:
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed += 1
+                        print(f"Failed to upload {self.bucket}/{name} to MinIO: {e}")
+
+        uploaded = len(changed) - failed
+        print(
+            f"Station registry synced to {self.bucket}: {uploaded} uploaded, "
+            f"{len(pending) - len(changed)} unchanged, {failed} failed in {time.perf_counter() - start:.2f}s"
+        )
+        return uploaded, len(pending) - len(changed), failed
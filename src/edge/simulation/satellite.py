@@ -0,0 +1,123 @@
+import io
+import struct
+import zlib
+import numpy as np
+import scipy.ndimage
+from PIL import Image
+
+# Colour of each fire state, indexed by state + 1: -1=black, 0=forest green, 1=red
+COLOUR_LUT = np.array([
+    [0, 0, 0],
+    [34, 139, 34],
+    [255, 0, 0],
+], dtype=np.uint8)
+
+# Compact state feed (sensors/satellite/state), read by fog/propagation/satellite_feed.py
+FEED_MAGIC = b"SATF"
+FEED_VERSION = 1
+KEYFRAME = 0
+DELTA_FRAME = 1
+# magic, version, frame type, sequence number, height, width, bbox (min_lon, min_lat, max_lon, max_lat)
+FEED_HEADER = struct.Struct(">4sBBIHH4d")
+
+
+class SatelliteRenderer:
+    """
+    Renders the fire grid as the blurred JPEG of the satellite view.
+
+    The engine bumps a generation counter whenever the fire grid changes: as
+    long as the generation is the same, render() returns the cached bytes.
+    Colour, blur and frame buffers are allocated once per grid shape.
+    """
+
+    def __init__(self):
+        self.generation = None
+        self.downscale_factor = None
+        self.jpeg = None
+        self.shape = None
+        self.frame = None
+
+    def _allocate(self, shape):
+        self.shape = shape
+        self.states = np.empty(shape, dtype=np.intp)
+        self.rgb = np.empty((*shape, 3), dtype=np.uint8)
+        self.blurred = np.empty_like(self.rgb)
+
+    def render(self, fire_grid, generation, downscale_factor=1):
+        if generation == self.generation and downscale_factor == self.downscale_factor:
+            return self.jpeg
+        if fire_grid.shape != self.shape:
+            self._allocate(fire_grid.shape)
+
+        np.add(fire_grid, 1, out=self.states, casting="unsafe")
+        np.take(COLOUR_LUT, self.states, axis=0, out=self.rgb)
+        # One pass over both spatial axes, channels are not mixed
+        scipy.ndimage.gaussian_filter(self.rgb, sigma=(1, 1, 0), output=self.blurred)
+
+        # Downsample, then flip vertically to correct y-axis inversion
+        frame = self.blurred[::downscale_factor, ::downscale_factor][::-1]
+        if self.frame is None or self.frame.shape != frame.shape:
+            self.frame = np.empty(frame.shape, dtype=np.uint8)
+        np.copyto(self.frame, frame)
+        buf = io.BytesIO()
+        Image.fromarray(self.frame, mode="RGB").save(buf, format="JPEG")
+
+        self.generation = generation
+        self.downscale_factor = downscale_factor
+        self.jpeg = buf.getvalue()
+        return self.jpeg
+
+
+def pack_states(states):
+    # 2 bits per cell, 4 cells per byte, first cell in the high bits
+    padded = np.zeros(-(-len(states) // 4) * 4, dtype=np.uint8)
+    padded[:len(states)] = states
+    quads = padded.reshape(-1, 4)
+    return (quads[:, 0] << 6 | quads[:, 1] << 4 | quads[:, 2] << 2 | quads[:, 3]).tobytes()
+
+
+class SatelliteFeedEncoder:
+    """
+    Encodes the fire grid as compact state frames: cell state is fire + 1
+    (0=burnt, 1=vegetation, 2=burning), rows from the southern edge up.
+
+    A keyframe holds the whole bit-packed raster. In between, delta frames
+    only hold the cells that changed since the previous frame, as index gaps
+    and packed states. Frame bodies are zlib-compressed. A keyframe is sent
+    every `keyframe_interval` frames, or whenever a delta would be larger.
+    """
+
+    def __init__(self, bbox, keyframe_interval=10):
+        self.bbox = tuple(bbox)
+        self.keyframe_interval = keyframe_interval
+        self.sequence = 0
+        self.previous = None
+        self.since_keyframe = 0
+
+    def encode(self, fire_grid):
+        states = (fire_grid + 1).astype(np.uint8).ravel()
+        frame_type = KEYFRAME
+        body = None
+        if (
+            self.previous is not None
+            and self.previous.shape == states.shape
+            and self.since_keyframe < self.keyframe_interval
+        ):
+            changed = np.flatnonzero(states != self.previous)
+            # 4 bytes of index + 2 bits of state per changed cell, against 2 bits per cell
+            if len(changed) * 17 < len(states):
+                gaps = np.diff(changed, prepend=0).astype(">u4")
+                body = struct.pack(">I", len(changed)) + gaps.tobytes() + pack_states(states[changed])
+                frame_type = DELTA_FRAME
+
+        if frame_type == KEYFRAME:
+            body = pack_states(states)
+            self.since_keyframe = 0
+        else:
+            self.since_keyframe += 1
+
+        self.sequence = (self.sequence + 1) % 2**32
+        self.previous = states
+        height, width = fire_grid.shape
+        header = FEED_HEADER.pack(FEED_MAGIC, FEED_VERSION, frame_type, self.sequence, height, width, *self.bbox)
+        return header + zlib.compress(body)
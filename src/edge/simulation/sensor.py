@@ -1,4 +1,27 @@
 from dataclasses import dataclass
+import numpy as np
+
+# Reading columns of SensorRegistry.readings, named as in the LoRa payload
+READING_FIELDS = [
+    "temperature",
+    "air_humidity",
+    "soil_humidity",
+    "air_pressure",
+    "rain",
+    "wind_speed",
+    "wind_direction",
+]
+
+# One record per sensor and per step
+PAYLOAD_DTYPE = np.dtype(
+    [
+        ("device_id", "<i8"),
+        ("timestamp", "<f8"),
+        ("battery_voltage", "<f8"),
+        ("statut_bits", "u1"),
+    ]
+    + [(field, "<f8") for field in READING_FIELDS]
+)
 
 @dataclass
 class Sensor:
@@ -14,4 +37,75 @@ class Sensor:
     read_rain: float = 0.0
     read_wind_s: float = 0.0
     read_wind_d: int = 0
-    
\ No newline at end of file
+
+
+class SensorRegistry:
+    """
+    Columnar store of the simulated stations: positions and latest readings
+    are NumPy arrays indexed by sensor position, payloads are produced in bulk.
+    """
+
+    def __init__(self, ids, x, y):
+        self.ids = np.asarray(ids)
+        self.x = np.asarray(x, dtype=np.intp)
+        self.y = np.asarray(y, dtype=np.intp)
+        self.readings = np.zeros((len(self.ids), len(READING_FIELDS)))
+        self.readings[:, READING_FIELDS.index("air_pressure")] = 1013.0
+        self._positions = {device_id: i for i, device_id in enumerate(self.ids.tolist())}
+
+    @classmethod
+    def from_map(cls, map):
+        x_unit = (map["bbox"][2] - map["bbox"][0]) / map["width"]
+        y_unit = (map["bbox"][3] - map["bbox"][1]) / map["height"]
+        sensors = map["sensors"]
+        lon = np.array([s["location"]["longitude"] for s in sensors], dtype=float)
+        lat = np.array([s["location"]["latitude"] for s in sensors], dtype=float)
+        return cls(
+            [s["device_id"] for s in sensors],
+            ((lon - map["bbox"][0]) / x_unit).astype(np.intp),
+            ((lat - map["bbox"][1]) / y_unit).astype(np.intp),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def frozen(self):
+        # Copy of the registry with read-only readings, positions are shared
+        copy = SensorRegistry.__new__(SensorRegistry)
+        copy.__dict__.update(self.__dict__)
+        copy.readings = self.readings.copy()
+        copy.readings.flags.writeable = False
+        return copy
+
+    def position(self, device_id):
+        return self._positions[device_id]
+
+    def __getitem__(self, i):
+        # Snapshot of one station, for debugging and display
+        temp, air_hum, soil_hum, pressure, rain, wind_s, wind_d = self.readings[i].tolist()
+        return Sensor(self.ids[i].item(), int(self.x[i]), int(self.y[i]), temp, air_hum, soil_hum, pressure, rain, wind_s, wind_d)
+
+    def records(self, timestamp, battery=3.6):
+        records = np.empty(len(self), dtype=PAYLOAD_DTYPE)
+        records["device_id"] = self.ids
+        records["timestamp"] = timestamp
+        records["battery_voltage"] = battery
+        records["statut_bits"] = 0
+        for i, field in enumerate(READING_FIELDS):
+            records[field] = self.readings[:, i]
+        return records
+
+    def payloads(self, timestamp, battery=3.6):
+        # Nested dict view of the records, as published on sensors/meteo/{id}/lora
+        return [
+            {
+                "metadata": {
+                    "device_id": device_id,
+                    "timestamp": timestamp,
+                    "battery_voltage": battery,
+                    "statut_bits": 0,
+                },
+                **dict(zip(READING_FIELDS, readings)),
+            }
+            for device_id, readings in zip(self.ids.tolist(), self.readings.tolist())
+        ]
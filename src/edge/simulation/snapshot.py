@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+from threading import Lock
+import numpy as np
+from sensor import SensorRegistry
+
+
+class FireGridLog:
+    """
+    Fire grid history shared by consecutive snapshots: a read-only keyframe
+    plus the cells changed before each later snapshot. The engine appends
+    deltas, readers materialize the grid of their snapshot on demand, so a
+    step costs its changed cells instead of a whole-grid copy.
+    """
+
+    def __init__(self, grid):
+        self.keyframe = read_only_copy(grid)
+        self.deltas = []  # (flat cells, new values) per snapshot
+        self.changed = 0  # cells over all deltas
+        self._lock = Lock()
+        self._cache = (0, self.keyframe)  # latest materialized (position, grid)
+
+    def append(self, cells, values):
+        # Engine thread only; readers never look past their own position
+        self.deltas.append((cells, values))
+        self.changed += len(cells)
+        return len(self.deltas)
+
+    def grid(self, position):
+        """Read-only fire grid once the first `position` deltas are applied."""
+        with self._lock:
+            cached_position, cached = self._cache
+            if cached_position == position:
+                return cached
+            if cached_position > position:
+                cached_position, cached = 0, self.keyframe
+            grid = cached.copy()
+            for cells, values in self.deltas[cached_position:position]:
+                np.put(grid, cells, values)
+            grid.flags.writeable = False
+            self._cache = (position, grid)
+            return grid
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """
+    Immutable view of the simulation after a step, published by the engine
+    and read by the publisher, satellite and GUI threads without locking.
+    Arrays are read-only copies, the fire grid is only copied when read.
+    """
+    version: int
+    timestamp: float
+    fire_generation: int
+    fire_log: FireGridLog
+    fire_position: int
+    sensors: SensorRegistry
+    wind_speed: float
+    wind_direction: float
+
+    @property
+    def fire_grid(self):
+        return self.fire_log.grid(self.fire_position)
+
+
+def read_only_copy(array):
+    copy = array.copy()
+    copy.flags.writeable = False
+    return copy
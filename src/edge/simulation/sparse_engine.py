@@ -0,0 +1,213 @@
+import numpy as np
+from engine import SimulationEngine
+from spread import NEIGHBOURS
+
+# Above this many pending wind steps a cell's random walk is drawn from its normal approximation
+EXACT_WIND_STEPS = 8
+
+
+class SparseSimulationEngine(SimulationEngine):
+    """
+    Simulation engine whose per-step cost follows fire activity instead of map size.
+
+    The burning front and the burnt cells bordering vegetation (the only ones
+    that can regrow) are kept as index sets, the burnt fraction is a running
+    counter and burnt ages are derived from the step at which each cell burnt.
+    The wind random walk is evaluated lazily: a cell catches up on the steps it
+    missed only when the front or a sensor reads it.
+    """
+    static_terms = False
+
+    def __init__(self, map, seed=None, compact=False, env=None):
+        self.step_count = 0
+        super().__init__(map, vectorized=True, seed=seed, compact=compact, env=env)
+
+        rows, cols = self.env.fire_grid.shape
+        self.wind_step_grid = np.zeros((rows, cols), dtype=np.int32)
+
+        # Cells read by the sensors, their wind must be up to date every step
+        self.sensor_read_cells = np.unique(self.sensor_windows[self.sensor_window_mask])
+
+        self.rebuild_index()
+
+    @property
+    def burnt_age_grid(self):
+        # Only materialized on demand (GUI, checkpoints), never on the step path
+        return np.where(self.env.fire_grid == -1, self.step_count - self.burnt_step_grid, 0).astype(np.int32)
+
+    @burnt_age_grid.setter
+    def burnt_age_grid(self, ages):
+        self.burnt_step_grid = (self.step_count - ages).astype(np.int32)
+
+    def rebuild_index(self):
+        # Full scan, only needed when fire_grid was set from outside the engine
+        grid = self.env.fire_grid
+        self.front = np.flatnonzero(grid == 1)
+        self.burnt_count = int(np.count_nonzero(grid == -1))
+        burnt = np.flatnonzero(grid == -1)
+        self.border = set(burnt[self._green_neighbours(burnt) > 0].tolist())
+        # The next snapshot starts from a keyframe of the new grid
+        self.fire_log = None
+
+    def checkpoint_state(self):
+        arrays = {
+            "burnt_step_grid": self.burnt_step_grid,
+            "wind_step_grid": self.wind_step_grid,
+            "front": self.front,
+            "border": np.fromiter(self.border, dtype=np.intp, count=len(self.border)),
+            "sensor_readings": self.sensors.readings,
+        }
+        scalars = {"fire_generation": self.fire_generation, "step_count": self.step_count, "burnt_count": self.burnt_count}
+        return arrays, scalars
+
+    def restore_checkpoint_state(self, arrays, scalars):
+        self.burnt_step_grid = arrays["burnt_step_grid"]
+        self.wind_step_grid = arrays["wind_step_grid"]
+        self.front = np.array(arrays["front"])
+        self.border = set(arrays["border"].tolist())
+        self.sensors.readings[...] = arrays["sensor_readings"]
+        self.fire_generation = scalars["fire_generation"]
+        self.step_count = scalars["step_count"]
+        self.burnt_count = scalars["burnt_count"]
+
+    def _neighbours(self, cells):
+        rows, cols = self.env.fire_grid.shape
+        r, c = np.divmod(cells, cols)
+        nr = r[:, None] + np.array([dr for dr, _ in NEIGHBOURS])
+        nc = c[:, None] + np.array([dc for _, dc in NEIGHBOURS])
+        valid = (nr >= 0) & (nr < rows) & (nc >= 0) & (nc < cols)
+        return np.where(valid, nr * cols + nc, 0), valid
+
+    def _green_neighbours(self, cells):
+        neighbours, valid = self._neighbours(cells)
+        return np.count_nonzero((self.env.fire_grid.take(neighbours) == 0) & valid, axis=1)
+
+    def _uniform_sum(self, counts, half_width):
+        # Sum of `counts` draws of U(-half_width, half_width) per cell
+        out = np.empty(len(counts))
+        exact = counts <= EXACT_WIND_STEPS
+        draws = self.rng.uniform(-half_width, half_width, (np.count_nonzero(exact), EXACT_WIND_STEPS))
+        out[exact] = (draws * (np.arange(EXACT_WIND_STEPS) < counts[exact, None])).sum(axis=1)
+        k = counts[~exact]
+        std = half_width * np.sqrt(k / 3.0)
+        out[~exact] = np.clip(self.rng.normal(0.0, std), -half_width * k, half_width * k)
+        return out
+
+    def _catch_up_wind(self, cells):
+        env = self.env
+        cells = np.unique(cells)
+        pending = self.step_count - self.wind_step_grid.take(cells)
+        stale = cells[pending > 0]
+        pending = pending[pending > 0]
+        if len(stale) == 0:
+            return
+
+        wind_dir = (env.wind_dir_map.take(stale) + self._uniform_sum(pending, 2.0)) % 360
+        wind_speed = np.clip(env.wind_speed_map.take(stale) + self._uniform_sum(pending, 1.0), 0, 100)
+        np.put(env.wind_dir_map, stale, wind_dir)
+        np.put(env.wind_speed_map, stale, wind_speed)
+        wind_dir = np.radians(wind_dir)
+        np.put(env.wind_u, stale, (wind_speed / 50.0) * np.cos(wind_dir))
+        np.put(env.wind_v, stale, (wind_speed / 50.0) * np.sin(wind_dir))
+        np.put(self.wind_step_grid, stale, self.step_count)
+
+    def start_fire(self):
+        x = int(self.rng.integers(self.fire_start_margin, self.env.x_size - self.fire_start_margin))
+        y = int(self.rng.integers(self.fire_start_margin, self.env.y_size - self.fire_start_margin))
+        print(f"Randomly starting fire at ({x}, {y})")
+        cell = np.ravel_multi_index((y, x), self.env.fire_grid.shape)
+        previous = self.env.fire_grid[y, x]
+        self.env.fire_grid[y, x] = 1
+        if previous != 1:
+            self.front = np.append(self.front, cell)
+        if previous == -1:
+            self.burnt_count -= 1
+        self.fire_generation += 1
+        self.fire_changes.append(np.array([cell]))
+        self._update_border(np.array([cell]))
+
+    def _spread(self):
+        env = self.env
+        rows, cols = env.fire_grid.shape
+        r, c = np.divmod(self.front, cols)
+        sources, targets, probs = [], [], []
+        for dr, dc in NEIGHBOURS:
+            nr, nc = r + dr, c + dc
+            valid = (nr >= 0) & (nr < rows) & (nc >= 0) & (nc < cols)
+            src = self.front[valid]
+            dst = nr[valid] * cols + nc[valid]
+            green = env.fire_grid.take(dst) == 0
+            sources.append((src[green], dst[green], dr, dc))
+        self._catch_up_wind(np.concatenate([dst for _, dst, _, _ in sources]))
+
+        for src, dst, dr, dc in sources:
+            targets.append(dst)
+            probs.append(env.get_cells_probability(src, dst, dr, dc))
+        targets = np.concatenate(targets)
+        probs = np.concatenate(probs)
+
+        # One independent trial per burning source -> green target pair, as in the reference loop
+        return np.unique(targets[self.rng.random(len(targets)) < probs])
+
+    def _regrow(self):
+        if not self.border:
+            return np.empty(0, dtype=np.intp)
+        candidates = np.fromiter(self.border, dtype=np.intp, count=len(self.border))
+        ages = self.step_count - self.burnt_step_grid.take(candidates)
+        old_enough = ages >= self.min_burnt_steps
+        candidates, ages = candidates[old_enough], ages[old_enough]
+
+        multiplier = np.minimum(self.max_regrow_multiplier, ages / self.min_burnt_steps)
+        regrow_prob = self.base_regrow_prob * self._green_neighbours(candidates) * multiplier
+        return candidates[self.rng.random(len(candidates)) < regrow_prob]
+
+    def _update_border(self, changed):
+        neighbours, valid = self._neighbours(changed)
+        affected = np.unique(np.concatenate([changed, neighbours[valid]]))
+        is_border = (self.env.fire_grid.take(affected) == -1) & (self._green_neighbours(affected) > 0)
+        self.border.difference_update(affected[~is_border].tolist())
+        self.border.update(affected[is_border].tolist())
+
+    def _apply_heat(self, cells):
+        env = self.env
+        temp, air_hum, soil_hum = env.draw_heat()
+        np.put(env.temp_map, cells, temp)
+        np.put(env.air_hum_map, cells, air_hum)
+        np.put(env.soil_hum_map, cells, soil_hum)
+
+    def step(self):
+        self.step_count += 1
+
+        total_cells = self.env.x_size * self.env.y_size
+        burnt_fraction = self.burnt_count / total_cells
+
+        if self.rng.random() < self.fire_start_probability(burnt_fraction):
+            self.start_fire()
+
+        # Both passes read the grid as it was at the start of the step
+        with self.timed("spread"):
+            ignited = self._spread()
+        with self.timed("regrowth"):
+            regrown = self._regrow()
+
+        burnt_out = self.front
+        np.put(self.env.fire_grid, burnt_out, -1)
+        np.put(self.burnt_step_grid, burnt_out, self.step_count)
+        np.put(self.env.fire_grid, ignited, 1)
+        np.put(self.env.fire_grid, regrown, 0)
+        self.burnt_count += len(burnt_out) - len(regrown)
+        self.front = ignited
+        changed = np.concatenate([burnt_out, ignited, regrown])
+        if len(changed):
+            self.fire_generation += 1
+            self.fire_changes.append(changed)
+        self._update_border(changed)
+
+        with self.timed("heat"):
+            self._apply_heat(ignited)
+        with self.timed("wind"):
+            self._catch_up_wind(self.sensor_read_cells)
+        with self.timed("sensors"):
+            self.update_sensors()
+        with self.timed("snapshot"):
+            self.publish_snapshot()
@@ -0,0 +1,118 @@
+import numpy as np
+
+# The 8 neighbour offsets (dr, dc) a burning cell can spread to
+NEIGHBOURS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)]
+
+# Independent per-cell random streams drawn each step
+STREAM_WIND_DIR = 0
+STREAM_WIND_SPEED = 1
+STREAM_SPREAD = 2
+STREAM_REGROW = 3
+
+
+def random_field(key, stream, shape, rows=None, cols=None, out=None):
+    """
+    Uniform [0, 1) values of the per-cell random field (key, stream) over a
+    grid of `shape`, restricted to the window [rows[0]:rows[1], cols[0]:cols[1]].
+
+    The field is counter-based (Philox): the value of a cell only depends on
+    the key, the stream and its position, so any tiling of the grid draws
+    exactly the same numbers as a single whole-grid draw. `out` is an optional
+    C-contiguous float64 buffer of the window shape, reused across steps.
+    """
+    height, width = shape
+    r0, r1 = rows if rows is not None else (0, height)
+    c0, c1 = cols if cols is not None else (0, width)
+    philox_key = (int(key) << 8) | stream
+    if out is None:
+        out = np.empty((r1 - r0, c1 - c0))
+
+    def draw(start, dst):
+        # Philox yields 4 doubles per counter increment
+        bit_generator = np.random.Philox(key=philox_key)
+        bit_generator.advance(start // 4)
+        generator = np.random.Generator(bit_generator)
+        if start % 4:
+            generator.random(start % 4)
+        generator.random(out=dst)
+
+    if c0 == 0 and c1 == width:
+        draw(r0 * width, out.reshape(-1))
+    else:
+        for i, r in enumerate(range(r0, r1)):
+            draw(r * width + c0, out[i])
+    return out
+
+
+def neighbour_slices(dr, dc):
+    """
+    Return (target, source) slices such that grid[..., target] are the cells
+    reached by moving (dr, dc) from grid[..., source].
+    """
+    def axis(d):
+        if d > 0:
+            return slice(d, None), slice(None, -d)
+        if d < 0:
+            return slice(None, d), slice(-d, None)
+        return slice(None), slice(None)
+
+    row_dst, row_src = axis(dr)
+    col_dst, col_src = axis(dc)
+    return (..., row_dst, col_dst), (..., row_src, col_src)
+
+
+def slope_term(alt_src, alt_dst):
+    alt_diff = alt_dst - alt_src
+    return np.where(alt_diff > 0, alt_diff * 0.2, -0.05)
+
+
+def ignition_probability(temp, air_hum, slope_term, wind_term):
+    dryness = (temp / 40.0) + (1.0 - (air_hum / 100.0))
+    return np.clip(0.10 * dryness + slope_term + wind_term, 0.0, 1.0)
+
+
+def spread_fire(fire_grid, direction_probability, rand):
+    """
+    Whole-grid fire spread.
+
+    Each burning cell tries to ignite each green neighbour independently, so a
+    green cell ignites with probability 1 - prod(1 - p_d) over its burning
+    neighbours d. A single uniform draw per cell is compared against it.
+    `direction_probability(dr, dc)` returns the ignition probability of the
+    target cells grid[neighbour_slices(dr, dc)[0]].
+    """
+    burning = fire_grid == 1
+    survival = np.ones(fire_grid.shape)
+    for dr, dc in NEIGHBOURS:
+        dst, src = neighbour_slices(dr, dc)
+        survival[dst] *= 1.0 - direction_probability(dr, dc) * burning[src]
+
+    new_fire = fire_grid.copy()
+    new_fire[burning] = -1
+    new_fire[(fire_grid == 0) & (rand < 1.0 - survival)] = 1
+    return new_fire
+
+
+def count_green_neighbours(fire_grid):
+    # Equivalent to a 3x3 convolution with a zero centre and zero padding
+    green = (fire_grid == 0).view(np.uint8)
+    counts = np.zeros(fire_grid.shape, dtype=np.uint8)
+    for dr, dc in NEIGHBOURS:
+        dst, src = neighbour_slices(dr, dc)
+        counts[dst] += green[src]
+    return counts
+
+
+def regrow(fire_grid, new_fire, burnt_age_grid, rand, min_burnt_steps, base_regrow_prob, max_regrow_multiplier):
+    """
+    Whole-grid regrowth: cells burnt for at least `min_burnt_steps` turn green
+    again with a probability proportional to their green neighbours, scaled
+    linearly with their age. Updates `new_fire` and `burnt_age_grid` in place.
+    """
+    green_neighbours = count_green_neighbours(fire_grid)
+    multiplier = np.minimum(max_regrow_multiplier, burnt_age_grid / min_burnt_steps)
+    regrow_prob = base_regrow_prob * green_neighbours * multiplier
+
+    regrown = (fire_grid == -1) & (burnt_age_grid >= min_burnt_steps) & (rand < regrow_prob)
+    new_fire[regrown] = 0
+    burnt_age_grid[regrown] = 0
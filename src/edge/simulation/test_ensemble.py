@@ -0,0 +1,16 @@
+import numpy as np
+from engine import SimulationEngine
+from ensemble import EnsembleSimulation
+
+
+def test_started_fires_count_as_burnt(monkeypatch):
+    # A fire starts in every member on the first step
+    always = classmethod(lambda cls, burnt_fraction: np.ones_like(burnt_fraction))
+    monkeypatch.setattr(SimulationEngine, "fire_start_probability", always)
+    ensemble = EnsembleSimulation({"width": 40, "height": 40}, members=4, seed=0)
+    ensemble.step()
+
+    assert ensemble.ever_burnt.any(axis=(1, 2)).all()
+    # Every cell that has been on fire, started or spread to, is counted
+    assert not (ensemble.env.fire_grid != 0)[~ensemble.ever_burnt].any()
+    assert (ensemble.burn_probability() > 0).any()
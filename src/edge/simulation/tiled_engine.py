@@ -0,0 +1,220 @@
+import os
+import numpy as np
+from multiprocessing import get_context, shared_memory
+from engine import SimulationEngine
+from environment import Environment
+from spread import STREAM_REGROW, STREAM_SPREAD, random_field, regrow, spread_fire
+
+# Environment maps read or written by the tiles, stored in shared memory
+SHARED_MAPS = [
+    "altitude_map",
+    "temp_map",
+    "air_hum_map",
+    "soil_hum_map",
+    "wind_speed_map",
+    "wind_dir_map",
+    "wind_u",
+    "wind_v",
+]
+# Maps each tile updates in place over its interior
+INTERIOR_MAPS = ["temp_map", "air_hum_map", "soil_hum_map", "wind_speed_map", "wind_dir_map", "wind_u", "wind_v"]
+# Maps the spread kernel reads over the tile and its one-cell halo
+HALO_MAPS = ["altitude_map", "temp_map", "air_hum_map", "wind_speed_map", "wind_u", "wind_v"]
+
+
+class TiledSimulationEngine(SimulationEngine):
+    """
+    Simulation engine splitting the grid into tiles stepped by a process pool.
+
+    All grids live in shared memory. Fire state is double-buffered: each tile
+    reads the current fire grid over its interior plus a one-cell halo and
+    writes the next state of its interior only, so the halo exchange happens
+    through shared memory at the step boundary when the buffers are swapped.
+    Per-cell randomness comes from counter-based fields (spread.random_field),
+    so a run matches the single-process SimulationEngine draw for draw.
+    """
+    static_terms = False
+
+    def __init__(self, map, tile_size=256, workers=None, seed=None, compact=False, env=None):
+        super().__init__(map, vectorized=True, seed=seed, compact=compact, env=env)
+        rows, cols = self.env.fire_grid.shape
+        self.tiles = [
+            (r0, min(r0 + tile_size, rows), c0, min(c0 + tile_size, cols))
+            for r0 in range(0, rows, tile_size)
+            for c0 in range(0, cols, tile_size)
+        ]
+
+        self._shm = {}
+        for name in SHARED_MAPS:
+            setattr(self.env, name, self._share(name, getattr(self.env, name)))
+        self.fire_buffers = [
+            self._share("fire_grid_0", self.env.fire_grid),
+            self._share("fire_grid_1", np.zeros_like(self.env.fire_grid)),
+        ]
+        self.current = 0
+        self.env.fire_grid = self.fire_buffers[self.current]
+        self.burnt_age_grid = self._share("burnt_age_grid", self.burnt_age_grid)
+        self.burnt_count = int(np.count_nonzero(self.env.fire_grid == -1))
+
+        self.workers = os.cpu_count() if workers is None else workers
+        # fork: workers must not re-import the service entry point. All of them are forked
+        # here, build the engine before any thread starts (forking a threaded process can deadlock)
+        self.pool = get_context("fork").Pool(self.workers) if self.workers > 0 else None
+        print(f"Tiled simulation: {len(self.tiles)} tiles of {tile_size}x{tile_size} on {self.workers} worker(s).")
+
+    def _share(self, name, array):
+        shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+        shared[...] = array
+        self._shm[name] = shm
+        return shared
+
+    def _layout(self):
+        return {
+            name: (shm.name, self._array(name).dtype.str)
+            for name, shm in self._shm.items()
+        }
+
+    def _array(self, name):
+        if name.startswith("fire_grid_"):
+            return self.fire_buffers[int(name[-1])]
+        if name == "burnt_age_grid":
+            return self.burnt_age_grid
+        return getattr(self.env, name)
+
+    def restore_checkpoint_state(self, arrays, scalars):
+        # Grids stay in shared memory, the checkpoint is copied into them
+        self.burnt_age_grid[...] = arrays["burnt_age_grid"]
+        self.sensors.readings[...] = arrays["sensor_readings"]
+        self.fire_generation = scalars["fire_generation"]
+
+    def step(self):
+        key = self.next_step_key()
+
+        total_cells = self.env.x_size * self.env.y_size
+        burnt_fraction = self.burnt_count / total_cells
+
+        if self.rng.random() < self.fire_start_probability(burnt_fraction):
+            self.start_fire()
+
+        heat = self.env.draw_heat()
+        regrow_params = (self.min_burnt_steps, self.base_regrow_prob, self.max_regrow_multiplier)
+        tasks = [
+            (self._layout(), self.env.fire_grid.shape, self.current, tile, key, heat, regrow_params)
+            for tile in self.tiles
+        ]
+        # Wind, spread, regrowth and heat all run inside the tiles
+        with self.timed("tiles"):
+            if self.pool is not None:
+                burnt_counts = list(self.pool.map(_step_tile, tasks))
+            else:
+                burnt_counts = [_step_tile(task) for task in tasks]
+
+        # Step boundary: every tile wrote its next state, swap the fire buffers
+        self.current = 1 - self.current
+        self.env.fire_grid = self.fire_buffers[self.current]
+        self.burnt_count = sum(burnt_counts)
+        changed = np.flatnonzero(self.fire_buffers[0] != self.fire_buffers[1])
+        if len(changed):
+            self.fire_generation += 1
+            self.fire_changes.append(changed)
+
+        with self.timed("sensors"):
+            self.update_sensors()
+        with self.timed("snapshot"):
+            self.publish_snapshot()
+
+    def close(self):
+        # Once no thread steps the engine: its grids are dropped, later use
+        # raises instead of touching unmapped memory
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+        for name in SHARED_MAPS:
+            setattr(self.env, name, None)
+        self.env.fire_grid = None
+        self.fire_buffers = None
+        self.burnt_age_grid = None
+        for shm in self._shm.values():
+            # In-process tiles keep their own handles on the segments
+            _attached.pop(shm.name, None)
+            shm.unlink()
+        for cache_key in [k for k in _tile_envs if k[0] == self._shm["altitude_map"].name]:
+            del _tile_envs[cache_key]
+        self._shm = {}
+
+
+# Per worker process: attached shared memory and tile environments
+_attached = {}
+_tile_envs = {}
+
+
+def _attach(layout):
+    maps = {}
+    for name, (shm_name, dtype) in layout.items():
+        if shm_name not in _attached:
+            _attached[shm_name] = shared_memory.SharedMemory(name=shm_name)
+        maps[name] = _attached[shm_name]
+    return maps
+
+
+def _tile_environments(layout, grid_shape, tile):
+    cache_key = (layout["altitude_map"][0], tile)
+    if cache_key in _tile_envs:
+        return _tile_envs[cache_key]
+
+    rows, cols = grid_shape
+    r0, r1, c0, c1 = tile
+    h0, h1, k0, k1 = max(r0 - 1, 0), min(r1 + 1, rows), max(c0 - 1, 0), min(c1 + 1, cols)
+    shms = _attach(layout)
+    grids = {
+        name: np.ndarray(grid_shape, dtype=np.dtype(dtype), buffer=shms[name].buf)
+        for name, (_, dtype) in layout.items()
+    }
+    interior = (slice(r0, r1), slice(c0, c1))
+    halo = (slice(h0, h1), slice(k0, k1))
+
+    interior_env = Environment.from_arrays(
+        {name: grids[name][interior] for name in INTERIOR_MAPS} | {"fire_grid": grids["fire_grid_0"][interior]},
+        origin=(r0, c0),
+        grid_shape=grid_shape,
+        static_terms=False,
+    )
+    halo_env = Environment.from_arrays(
+        {name: grids[name][halo] for name in HALO_MAPS} | {"fire_grid": grids["fire_grid_0"][halo]},
+        origin=(h0, k0),
+        grid_shape=grid_shape,
+    )
+    inner = (slice(r0 - h0, r1 - h0), slice(c0 - k0, c1 - k0))
+    _tile_envs[cache_key] = (grids, interior, halo, inner, interior_env, halo_env)
+    return _tile_envs[cache_key]
+
+
+def _step_tile(task):
+    layout, grid_shape, current, tile, key, heat, regrow_params = task
+    grids, interior, halo, inner, interior_env, halo_env = _tile_environments(layout, grid_shape, tile)
+    fire = grids[f"fire_grid_{current}"]
+    fire_next = grids[f"fire_grid_{1 - current}"]
+    (h0, h1), (k0, k1) = [(s.start, s.stop) for s in halo]
+
+    # Wind only evolves over the interior: the spread kernel reads it at target cells
+    interior_env.evolve_wind(key)
+
+    # Halo cells belong to neighbouring tiles, their results are computed but discarded
+    fire_halo = fire[halo]
+    age = grids["burnt_age_grid"][halo].copy()
+    age[fire_halo == -1] += 1
+    age[fire_halo != -1] = 0
+
+    halo_env.fire_grid = fire_halo
+    rand = random_field(key, STREAM_SPREAD, grid_shape, (h0, h1), (k0, k1), out=halo_env.random_buffer)
+    new_fire = spread_fire(fire_halo, halo_env.get_direction_probability, rand)
+    rand = random_field(key, STREAM_REGROW, grid_shape, (h0, h1), (k0, k1), out=halo_env.random_buffer)
+    regrow(fire_halo, new_fire, age, rand, *regrow_params)
+
+    fire_next[interior] = new_fire[inner]
+    grids["burnt_age_grid"][interior] = age[inner]
+
+    interior_env.fire_grid = fire_next[interior]
+    interior_env.apply_heat_from_fire(heat)
+    return int(np.count_nonzero(fire_next[interior] == -1))
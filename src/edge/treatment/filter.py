@@ -1,27 +1,179 @@
-from collections import defaultdict
-
-# Buffer to accumulate payloads per device (sliding window)
-_payload_buffer = defaultdict(list)
-# Sliding window size
-WINDOW_SIZE = 6
-
-def _generate_mean_payload(payloads):
-    if not payloads:
-        return {}
-    mean = {}
-    keys = payloads[0].keys()
-    for k in keys:
-        # Only average numeric fields
-        values = [p[k] for p in payloads if isinstance(p.get(k), (int, float))]
-        if values:
-            mean[k] = sum(values) / len(values)
+import math
+import os
+import time
+from collections import OrderedDict
+from order_statistics import RollingWindow
+
+# mean: average of the window, median: median of each field's window,
+# hampel: values further than HAMPEL_K robust deviations from the median are replaced by it
+FILTER_MODES = ("mean", "median", "hampel")
+FILTER_MODE = os.getenv("FILTER_MODE", "mean").strip().lower()
+if FILTER_MODE not in FILTER_MODES:
+    raise ValueError(f"Unknown FILTER_MODE {FILTER_MODE!r}, expected one of {FILTER_MODES}")
+# Sliding window size, and per-field sizes for the median and hampel modes, e.g. "rain=15,temperature=9"
+WINDOW_SIZE = int(os.getenv("FILTER_WINDOW", "6"))
+FIELD_WINDOWS = {
+    field.strip(): int(size)
+    for field, size in (item.split("=") for item in os.getenv("FILTER_WINDOWS", "").split(",") if item.strip())
+}
+HAMPEL_K = float(os.getenv("HAMPEL_K", "3"))
+# Interquartile range of a normal distribution in standard deviations
+IQR_TO_SIGMA = 1.349
+# Device table bounds: least recently seen devices are evicted beyond the size or after the TTL
+MAX_DEVICES = int(os.getenv("FILTER_MAX_DEVICES", "10000"))
+DEVICE_TTL = float(os.getenv("FILTER_DEVICE_TTL", "3600"))
+# Running sums are recomputed from the window every N updates to bound float drift
+RESUM_INTERVAL = 256
+
+
+class DeviceWindow:
+    """
+    Sliding window of the last `size` payloads of one device.
+
+    Numeric fields live in preallocated ring rows with running sums and
+    counts, so a new payload updates the mean in O(fields) whatever the
+    window size. The mean keeps the keys and the non-numeric fields
+    (metadata) of the oldest payload in the window.
+    """
+
+    __slots__ = ("size", "fields", "values", "present", "sums", "counts", "payloads", "head", "length", "updates", "last_seen")
+
+    def __init__(self, size=WINDOW_SIZE):
+        self.size = size
+        self.fields = {}  # numeric field -> column
+        self.values = [[] for _ in range(size)]  # one row of floats per slot, absent fields are 0.0
+        self.present = [[] for _ in range(size)]
+        self.sums = []
+        self.counts = []
+        self.payloads = [None] * size  # for the keys and non-numeric fields of each slot
+        self.head = 0  # next slot written, the oldest one once the window is full
+        self.length = 0
+        self.updates = 0
+        self.last_seen = 0.0
+
+    def _add_field(self, key):
+        self.fields[key] = len(self.fields)
+        for row, mask in zip(self.values, self.present):
+            row.append(0.0)
+            mask.append(False)
+        self.sums.append(0.0)
+        self.counts.append(0)
+
+    def push(self, payload):
+        fields = self.fields
+        # Non-finite readings would poison the running sums, the field is absent from the slot
+        numeric = [(k, v) for k, v in payload.items() if isinstance(v, (int, float)) and math.isfinite(v)]
+        for k, _ in numeric:
+            if k not in fields:
+                self._add_field(k)
+
+        slot = self.head
+        row, mask = self.values[slot], self.present[slot]
+        sums, counts = self.sums, self.counts
+        if self.length == self.size:
+            # Drop the oldest payload from the sums
+            for column, present in enumerate(mask):
+                if present:
+                    sums[column] -= row[column]
+                    counts[column] -= 1
+                    row[column] = 0.0
+                    mask[column] = False
         else:
-            mean[k] = payloads[0][k]
-    return mean
-
-def mean_payload(device_id, payload):
-    buf = _payload_buffer[device_id]
-    buf.append(payload)
-    if len(buf) > WINDOW_SIZE:
-        buf.pop(0)  # Remove oldest
-    return _generate_mean_payload(buf)
\ No newline at end of file
+            self.length += 1
+
+        for k, v in numeric:
+            column = fields[k]
+            row[column] = v
+            mask[column] = True
+            sums[column] += v
+            counts[column] += 1
+        self.payloads[slot] = payload
+        self.head = (slot + 1) % self.size
+
+        self.updates += 1
+        if self.updates % RESUM_INTERVAL == 0:
+            self.sums = [math.fsum(column) for column in zip(*self.values)]
+
+    def mean(self):
+        oldest = self.payloads[(self.head - self.length) % self.size]
+        fields, sums, counts = self.fields, self.sums, self.counts
+        mean = {}
+        for k, v in oldest.items():
+            column = fields.get(k)
+            # Only average numeric fields
+            mean[k] = sums[column] / counts[column] if column is not None and counts[column] else v
+        return mean
+
+
+class RobustWindow:
+    """
+    Per-field sliding windows of one device kept in order statistics
+    structures, so the median and quartiles cost O(log w) per update.
+    The result keeps the keys and non-numeric fields of the latest payload.
+    """
+
+    __slots__ = ("hampel", "fields", "last_seen")
+
+    def __init__(self, hampel=False):
+        self.hampel = hampel
+        self.fields = {}  # numeric field -> RollingWindow
+        self.last_seen = 0.0
+
+    def filter(self, payload):
+        filtered = {}
+        for k, v in payload.items():
+            if not isinstance(v, (int, float)):
+                filtered[k] = v
+                continue
+            window = self.fields.get(k)
+            if window is None:
+                window = self.fields[k] = RollingWindow(FIELD_WINDOWS.get(k, WINDOW_SIZE))
+            if not math.isfinite(v):
+                # NaN has no rank: never pushed, replaced by the median when there is one
+                filtered[k] = window.median() if window.values else v
+                continue
+            window.push(v)
+            median = window.median()
+            if self.hampel:
+                # Robust deviation from the interquartile range, the MAD has no cheap incremental update
+                sigma = (window.quantile(0.75) - window.quantile(0.25)) / IQR_TO_SIGMA
+                filtered[k] = median if abs(v - median) > HAMPEL_K * sigma else v
+            else:
+                filtered[k] = median
+        return filtered
+
+
+# Windows per device, least recently seen first
+_devices = OrderedDict()
+
+
+def _new_window():
+    if FILTER_MODE == "mean":
+        return DeviceWindow()
+    return RobustWindow(hampel=FILTER_MODE == "hampel")
+
+
+def _window(device_id):
+    now = time.monotonic()
+    window = _devices.get(device_id)
+    if window is None:
+        window = _devices[device_id] = _new_window()
+    else:
+        _devices.move_to_end(device_id)
+    window.last_seen = now
+
+    # Evict from the least recently seen end, O(1) amortized per message
+    while len(_devices) > MAX_DEVICES:
+        _devices.popitem(last=False)
+    while now - next(iter(_devices.values())).last_seen > DEVICE_TTL:
+        _devices.popitem(last=False)
+    return window
+
+
+def filter_payload(device_id, payload):
+    """Filter a payload with the FILTER_MODE window of its device."""
+    window = _window(device_id)
+    if FILTER_MODE == "mean":
+        window.push(payload)
+        return window.mean()
+    return window.filter(payload)
@@ -0,0 +1,65 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from schema import MAX_FRAME_RECORDS, WEATHER_SCHEMA
+
+# Readings per LoRa frame, 1 sends the single 20-byte frames
+FRAME_RECORDS = min(int(os.getenv("FRAME_RECORDS", "1")), MAX_FRAME_RECORDS)
+# Pending readings are sent after this many seconds even if the frame is not full
+FRAME_MAX_DELAY = float(os.getenv("FRAME_MAX_DELAY", "30"))
+# Seconds between two checks for overdue frames by the treatment loops (see flush_due)
+FRAME_FLUSH_INTERVAL = max(0.1, min(1.0, FRAME_MAX_DELAY))
+
+
+class FrameBatcher:
+    """
+    Groups the treated readings of each device into multi-record frames of
+    `records` readings. Devices are kept in the order of their oldest pending
+    reading, so late frames are found from the front in O(1) per message.
+    Frames are also sent when flush_due is called, so that the readings of a
+    device gone quiet do not wait for its next one. Safe to share between
+    the MQTT thread and a timer.
+    """
+
+    def __init__(self, records=FRAME_RECORDS, max_delay=FRAME_MAX_DELAY, schema=WEATHER_SCHEMA):
+        self.records = records
+        self.max_delay = max_delay
+        self.schema = schema
+        self.pending = OrderedDict()  # device_id -> (first reading time, quantized rows)
+        self.lock = threading.Lock()
+
+    def add(self, device_id, payload):
+        """Queue a payload and return the (device_id, frame) pairs ready to send."""
+        # Quantized now, an invalid payload fails alone rather than with its frame
+        row = self.schema.quantize(payload)
+        now = time.monotonic()
+        with self.lock:
+            entry = self.pending.get(device_id)
+            if entry is None:
+                entry = self.pending[device_id] = (now, [])
+            entry[1].append(row)
+
+            ready = []
+            if len(entry[1]) >= self.records:
+                ready.append(self._take(device_id))
+            return ready + self._take_due(now)
+
+    def flush_due(self):
+        """(device_id, frame) pairs whose oldest reading waited FRAME_MAX_DELAY."""
+        with self.lock:
+            return self._take_due(time.monotonic())
+
+    def flush(self):
+        with self.lock:
+            return [self._take(device_id) for device_id in list(self.pending)]
+
+    def _take_due(self, now):
+        due = []
+        while self.pending and now - next(iter(self.pending.values()))[0] >= self.max_delay:
+            due.append(self._take(next(iter(self.pending))))
+        return due
+
+    def _take(self, device_id):
+        _, rows = self.pending.pop(device_id)
+        return device_id, self.schema.pack_frame(rows)
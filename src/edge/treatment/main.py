@@ -3,7 +3,11 @@ import os
 import threading
 import logging
 
-from process import on_message
+from frames import FRAME_FLUSH_INTERVAL
+from metrics import METRICS_INTERVAL, METRICS_PORT, STATS_TOPIC, publish_stats, serve_http
+from pipeline import AsyncPipeline
+from process import BATCH_TOPIC, SLOT_BATCH_TOPIC, flush_due_frames, flush_frames, on_batch_message, on_message
+from sharding import ShardedPool
 
 # Configure logging
 logging.basicConfig(
@@ -13,6 +17,28 @@ logging.basicConfig(
 MQTT_BROKER = os.getenv("MQTT_BROKER", "localhost")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 KEEP_ALIVE = int(os.getenv("KEEP_ALIVE", "60"))
+# inline: treatment in the MQTT thread, sharded: worker processes by device id,
+# async: bounded queue and micro-batches on an asyncio loop
+TREATMENT_WORKERS = int(os.getenv("TREATMENT_WORKERS", "0"))
+TREATMENT_MODE = os.getenv("TREATMENT_MODE", "sharded" if TREATMENT_WORKERS > 0 else "inline")
+# Queued readings in async mode, queued messages per worker in sharded mode
+TREATMENT_QUEUE_SIZE = int(os.getenv("TREATMENT_QUEUE_SIZE", "10000"))
+# Sharded: seconds the MQTT thread waits on a full worker queue before dropping
+TREATMENT_PUT_TIMEOUT = float(os.getenv("TREATMENT_PUT_TIMEOUT", "1"))
+# Async: readings treated per tick
+TREATMENT_BATCH_SIZE = int(os.getenv("TREATMENT_BATCH_SIZE", "100"))
+TREATMENT_OVERLOAD = os.getenv("TREATMENT_OVERLOAD", "drop_oldest")
+
+pool = None
+if TREATMENT_MODE == "sharded":
+    pool = ShardedPool(
+        max(TREATMENT_WORKERS, 1), MQTT_BROKER, MQTT_PORT, KEEP_ALIVE, TREATMENT_QUEUE_SIZE, TREATMENT_PUT_TIMEOUT
+    )
+    pool.start()
+    logging.info(f"Started {len(pool.processes)} treatment worker(s)")
+elif TREATMENT_MODE not in ("inline", "async"):
+    logging.error(f"Unknown TREATMENT_MODE '{TREATMENT_MODE}'")
+    exit()
 
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
 try:
@@ -24,17 +50,64 @@ except Exception as e:
     logging.error(f"Failed to connect to MQTT broker: {e}")
     exit()
 
+pipeline = None
+if TREATMENT_MODE == "async":
+    pipeline = AsyncPipeline(client, TREATMENT_QUEUE_SIZE, TREATMENT_BATCH_SIZE, TREATMENT_OVERLOAD)
+    handlers = pipeline.on_message, pipeline.on_message
+elif pool:
+    handlers = pool.on_message, pool.on_batch_message
+else:
+    handlers = on_message, on_batch_message
 
 client.subscribe("sensors/meteo/+/lora")
-client.message_callback_add("sensors/meteo/+/lora", on_message)
+client.message_callback_add("sensors/meteo/+/lora", handlers[0])
+
+for topic in (BATCH_TOPIC, SLOT_BATCH_TOPIC):
+    client.subscribe(topic)
+    client.message_callback_add(topic, handlers[1])
+
+logging.info(
+    f"Subscribed to topics 'sensors/meteo/+/lora', '{BATCH_TOPIC}' and '{SLOT_BATCH_TOPIC}'. Waiting for messages..."
+)
+
+# Sharded workers publish their own stats, the routing process has none
+if not pool:
+    if METRICS_PORT:
+        serve_http()
+    if METRICS_INTERVAL > 0:
+        publish_stats(client, TREATMENT_MODE)
+elif METRICS_PORT:
+    logging.warning(
+        f"METRICS_PORT is ignored in sharded mode: set METRICS_INTERVAL, workers publish their stats on "
+        f"{STATS_TOPIC}/worker-<n>"
+    )
 
-logging.info("Subscribed to topic 'sensors/meteo/+/lora'. Waiting for messages...")
+if pipeline:
+    # Returns on Ctrl-C once the queued readings are treated
+    pipeline.serve()
+    logging.info("Disconnecting from MQTT broker...")
+    client.loop_stop()
+    client.disconnect()
+    logging.info("Disconnected successfully!")
+    exit()
 
 stop_event = threading.Event()
 try:
-    stop_event.wait()
+    if pool:
+        stop_event.wait()
+    else:
+        # Inline: the partial frames of devices gone quiet are sent from here
+        while not stop_event.wait(FRAME_FLUSH_INTERVAL):
+            flush_due_frames(client)
 except KeyboardInterrupt:
     logging.info("Disconnecting from MQTT broker...")
-    client.loop_stop()
+    if pool:
+        # No more routing, then workers send their pending frames and exit
+        client.loop_stop()
+        pool.stop()
+    else:
+        # Send the readings still waiting for a full frame
+        flush_frames(client)
+        client.loop_stop()
     client.disconnect()
     logging.info("Disconnected successfully!")
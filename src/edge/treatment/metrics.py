@@ -0,0 +1,161 @@
+"""
+Treatment instrumentation: per-stage latency histograms, per-device message
+rates and sampled logging, exposed as JSON on a local HTTP endpoint
+(METRICS_PORT) and/or a periodic MQTT stats topic (METRICS_INTERVAL).
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "0"))
+STATS_TOPIC = os.getenv("STATS_TOPIC", "edge/treatment/stats")
+# One per-message INFO line out of LOG_SAMPLE_EVERY, the others go to DEBUG
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+if LOG_SAMPLE_EVERY < 1:
+    raise ValueError(f"LOG_SAMPLE_EVERY must be at least 1, not {LOG_SAMPLE_EVERY}")
+
+STAGES = ("decode", "filter", "encode", "publish")
+# Histogram bucket upper bounds in seconds: 1 µs to ~16 s, doubling
+BUCKETS = tuple(1e-6 * 2 ** i for i in range(25))
+
+
+class LatencyHistogram:
+    """Fixed log-scale buckets, observing costs one bisect."""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds, n=1):
+        # n messages treated together, seconds / n each
+        each = seconds / n
+        self.counts[bisect.bisect_left(BUCKETS, each)] += n
+        self.count += n
+        self.sum += seconds
+        if each > self.max:
+            self.max = each
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the quantile
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_us": self.sum / self.count * 1e6 if self.count else 0.0,
+            "p50_us": self.quantile(0.5) * 1e6 if self.count else 0.0,
+            "p90_us": self.quantile(0.9) * 1e6 if self.count else 0.0,
+            "p99_us": self.quantile(0.99) * 1e6 if self.count else 0.0,
+            "max_us": self.max * 1e6,
+        }
+
+
+class Metrics:
+    """
+    Counters of one treatment process. Updates come from a single thread
+    (MQTT thread, event loop or worker); snapshots only read them, so a
+    snapshot may mix values of two consecutive messages but needs no lock.
+    Rates are computed against the previous snapshot of the same consumer,
+    which keeps it (see snapshot).
+    """
+
+    def __init__(self):
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.devices = {}  # device_id -> messages
+        self.messages = 0
+        self.started = time.monotonic()
+
+    def observe(self, stage, seconds, n=1):
+        self.stages[stage].observe(seconds, n)
+
+    def count(self, device_id):
+        self.devices[device_id] = self.devices.get(device_id, 0) + 1
+        self.messages += 1
+
+    def sample(self):
+        # True for one message out of LOG_SAMPLE_EVERY
+        return self.messages % LOG_SAMPLE_EVERY == 0
+
+    def snapshot(self, last=None):
+        """
+        Totals, plus rates since `last`, the state returned with the previous
+        snapshot of the same consumer (since start when None). Returns
+        (snapshot, state to pass to the next call).
+        """
+        now = time.monotonic()
+        devices = dict(self.devices)
+        messages = self.messages
+        last_time, last_messages, last_devices = last or (self.started, 0, {})
+        elapsed = max(now - last_time, 1e-9)
+        snapshot = {
+            "uptime_s": now - self.started,
+            "messages": messages,
+            "messages_per_s": (messages - last_messages) / elapsed,
+            "stages": {stage: histogram.summary() for stage, histogram in self.stages.items()},
+            "devices": {
+                str(device_id): {"messages": count, "per_s": (count - last_devices.get(device_id, 0)) / elapsed}
+                for device_id, count in devices.items()
+            },
+        }
+        return snapshot, (now, messages, devices)
+
+
+METRICS = Metrics()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        # Scrapes share one rate window, apart from the stats publisher
+        with self.server.lock:
+            snapshot, self.server.last = METRICS.snapshot(self.server.last)
+        body = json.dumps(snapshot).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # No access log on the hot path
+
+
+def serve_http(port=METRICS_PORT):
+    server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    server.lock = threading.Lock()
+    server.last = None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Metrics served on http://0.0.0.0:{port}/metrics")
+    return server
+
+
+def publish_stats(client, name, interval=METRICS_INTERVAL):
+    """Publish a snapshot on STATS_TOPIC/<name> every `interval` seconds."""
+    def loop():
+        last = None
+        while True:
+            time.sleep(interval)
+            try:
+                snapshot, last = METRICS.snapshot(last)
+                client.publish(f"{STATS_TOPIC}/{name}", json.dumps(snapshot))
+            except Exception as e:
+                logging.error(f"Error publishing treatment stats: {e}")
+
+    threading.Thread(target=loop, daemon=True).start()
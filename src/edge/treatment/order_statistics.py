@@ -0,0 +1,118 @@
+import math
+import random
+from collections import deque
+
+# Deterministic node levels, the skiplist shape does not depend on the process
+_levels = random.Random(0)
+
+
+class _Node:
+    __slots__ = ("value", "next", "width")
+
+    def __init__(self, value, next, width):
+        self.value = value
+        self.next = next
+        self.width = width
+
+
+_NIL = _Node(math.inf, [], [])
+
+
+class IndexableSkiplist:
+    """
+    Sorted multiset with O(log n) insert, remove and access by rank.
+    Each link stores how many elements it skips, so rank lookups walk down
+    the levels like a search.
+    """
+
+    def __init__(self, expected_size=100):
+        self.size = 0
+        self.maxlevels = int(1 + math.log2(max(expected_size, 2)))
+        self.head = _Node(None, [_NIL] * self.maxlevels, [1] * self.maxlevels)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        node = self.head
+        i += 1
+        for level in reversed(range(self.maxlevels)):
+            while node.width[level] <= i:
+                i -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def insert(self, value):
+        # Last node before value at each level, and the distance walked to reach it
+        chain = [None] * self.maxlevels
+        steps_at_level = [0] * self.maxlevels
+        node = self.head
+        for level in reversed(range(self.maxlevels)):
+            while node.next[level].value <= value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        d = min(self.maxlevels, 1 - int(math.log2(_levels.random() or 1e-300)))
+        new = _Node(value, [None] * d, [None] * d)
+        steps = 0
+        for level in range(d):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(d, self.maxlevels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value):
+        chain = [None] * self.maxlevels
+        node = self.head
+        for level in reversed(range(self.maxlevels)):
+            while node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        if value != chain[0].next[0].value:
+            raise KeyError("Not found")
+
+        d = len(chain[0].next[0].next)
+        for level in range(d):
+            prev = chain[level]
+            prev.width[level] += prev.next[level].width[level] - 1
+            prev.next[level] = prev.next[level].next[level]
+        for level in range(d, self.maxlevels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+
+class RollingWindow:
+    """Last `size` values of a stream with their order statistics."""
+
+    __slots__ = ("size", "values", "sorted")
+
+    def __init__(self, size):
+        self.size = size
+        self.values = deque()
+        self.sorted = IndexableSkiplist(size)
+
+    def push(self, value):
+        if len(self.values) == self.size:
+            # Popped once removed, so a failed remove leaves both structures in sync
+            self.sorted.remove(self.values[0])
+            self.values.popleft()
+        self.values.append(value)
+        self.sorted.insert(value)
+
+    def quantile(self, q):
+        # Linear interpolation between the closest ranks
+        position = (len(self.values) - 1) * q
+        lower = int(position)
+        value = self.sorted[lower]
+        if position > lower:
+            value += (self.sorted[lower + 1] - value) * (position - lower)
+        return value
+
+    def median(self):
+        return self.quantile(0.5)
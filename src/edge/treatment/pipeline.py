@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import signal
+import time
+from collections import OrderedDict, deque
+
+from frames import FRAME_FLUSH_INTERVAL
+from process import flush_due_frames, flush_frames, message_payloads, publish_frames, treat_payloads
+
+# What to do with a reading arriving while the ingest queue is full:
+# drop_oldest / drop_newest, or latest: keep only the latest pending reading of
+# each device, so a burst is coalesced before the queue ever fills
+OVERLOAD_POLICIES = ("drop_oldest", "drop_newest", "latest")
+# Seconds between two overload warnings
+OVERLOAD_LOG_INTERVAL = 10
+
+
+class AsyncPipeline:
+    """
+    Treatment on an asyncio event loop. The MQTT network thread hands raw
+    messages to the loop, which splits them into readings kept in a bounded
+    ingest queue; a single consumer drains up to `batch_size` readings per
+    tick, treats them as one batch and publishes the frames through the
+    shared client. Queued readings are bounded whatever the input rate, so
+    is the time a reading waits before being treated.
+    """
+
+    def __init__(self, client, queue_size=1000, batch_size=100, overload="drop_oldest"):
+        if overload not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy {overload!r}, expected one of {OVERLOAD_POLICIES}")
+        self.client = client
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.overload = overload
+        # (device_id, payload) in arrival order, or device_id -> payload with the latest policy
+        self.pending = OrderedDict() if overload == "latest" else deque()
+        self.dropped = 0
+        self.coalesced = 0
+        self.treated = 0
+        # Created now so that messages handed over before serve() wait on it
+        self.loop = asyncio.new_event_loop()
+        self.ready = asyncio.Event()
+        self.stopping = False
+        self._last_warning = 0.0
+
+    def on_message(self, client, _, msg):
+        # MQTT network thread: only hand the message over to the loop
+        self.loop.call_soon_threadsafe(self._ingest, msg.topic, msg.payload)
+
+    def _ingest(self, topic, data):
+        try:
+            # A batch holds many devices: split before queueing, so every policy works per reading
+            entries = message_payloads(topic, data)
+        except Exception as e:
+            logging.error(f"Error decoding message on {topic}: {e}")
+            return
+        pending = self.pending
+        for device_id, payload in entries:
+            if self.overload == "latest" and device_id in pending:
+                # Replaced in place, the device keeps its turn
+                pending[device_id] = payload
+                self.coalesced += 1
+            elif len(pending) >= self.queue_size:
+                self.dropped += 1
+                if self.overload != "drop_newest":
+                    self._pop()
+                    self._push(device_id, payload)
+            else:
+                self._push(device_id, payload)
+        self.ready.set()
+
+    def _push(self, device_id, payload):
+        if self.overload == "latest":
+            self.pending[device_id] = payload
+        else:
+            self.pending.append((device_id, payload))
+
+    def _pop(self):
+        return self.pending.popitem(last=False) if self.overload == "latest" else self.pending.popleft()
+
+    def _warn_overload(self):
+        now = time.monotonic()
+        if (self.dropped or self.coalesced) and now - self._last_warning >= OVERLOAD_LOG_INTERVAL:
+            self._last_warning = now
+            logging.warning(
+                f"Treatment overloaded: {self.dropped} reading(s) dropped, {self.coalesced} coalesced so far "
+                f"({len(self.pending)} queued)"
+            )
+
+    def _drain(self):
+        entries = [self._pop() for _ in range(min(self.batch_size, len(self.pending)))]
+        publish_frames(self.client, treat_payloads(entries))
+        self.treated += len(entries)
+        logging.debug("Treated %d reading(s), %d queued", len(entries), len(self.pending))
+
+    async def run(self):
+        next_flush = time.monotonic() + FRAME_FLUSH_INTERVAL
+        while not self.stopping or self.pending:
+            if time.monotonic() >= next_flush:
+                # Partial frames of devices gone quiet
+                flush_due_frames(self.client)
+                next_flush = time.monotonic() + FRAME_FLUSH_INTERVAL
+            if not self.pending:
+                self.ready.clear()
+                try:
+                    await asyncio.wait_for(self.ready.wait(), max(0.0, next_flush - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self._drain()
+            self._warn_overload()
+            # Let the handed over messages in between two batches
+            await asyncio.sleep(0)
+        flush_frames(self.client)
+
+    def _stop(self):
+        self.stopping = True
+        self.ready.set()
+
+    def stop(self):
+        # From any thread: treat what is queued, then return from run
+        self.loop.call_soon_threadsafe(self._stop)
+
+    def serve(self):
+        """Run the pipeline in this (main) thread until stop() or Ctrl-C."""
+        self.loop.add_signal_handler(signal.SIGINT, self._stop)
+        try:
+            self.loop.run_until_complete(self.run())
+        finally:
+            self.loop.close()
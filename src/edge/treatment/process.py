@@ -1,25 +1,121 @@
 import json
 import logging
+from time import perf_counter
 from paho.mqtt.client import Client, MQTTMessage
 
-from filter import mean_payload
-from discrete import payload_to_discrete
-from compress import payload_to_bytes
+from filter import filter_payload
+from frames import FRAME_RECORDS, FrameBatcher
+from metrics import LOG_SAMPLE_EVERY, METRICS
+from schema import WEATHER_SCHEMA
+
+# Per-step batch of the simulation: a JSON array of sensor payloads, on this topic
+# or split by device slot on BATCH_TOPIC/<slot> (see sharding.SHARD_SLOTS)
+BATCH_TOPIC = "sensors/meteo/batch"
+SLOT_BATCH_TOPIC = BATCH_TOPIC + "/+"
+
+# Multi-record frames of FRAME_RECORDS readings per device, when enabled
+frame_batcher = FrameBatcher() if FRAME_RECORDS > 1 else None
+
+def publish_frames(client: Client, frames):
+    start = perf_counter()
+    for device_id, frame in frames:
+        # Lazy formatting, the hot path does not pay for disabled debug logs
+        logging.debug("Pretreated frame of device %s: %s", device_id, frame)
+        client.publish(f"sensors/meteo/{device_id}/raw", frame)
+    if frames:
+        METRICS.observe("publish", perf_counter() - start, len(frames))
+
+def message_payloads(topic, data):
+    """(device_id, payload) pairs of a raw message, a single reading or a batch."""
+    start = perf_counter()
+    payload = json.loads(data)
+    if not topic.startswith(BATCH_TOPIC):
+        METRICS.observe("decode", perf_counter() - start)
+        return [(topic.split("/")[2], payload)]
+    entries = []
+    for item in payload:
+        try:
+            # Device ids are strings when they come from the topic
+            entries.append((str(item["metadata"]["device_id"]), item))
+        except Exception as e:
+            logging.error(f"Error processing batch payload: {e}")
+    if entries:
+        METRICS.observe("decode", perf_counter() - start, len(entries))
+    return entries
+
+def _encode(device_ids, payloads):
+    start = perf_counter()
+    if len(payloads) > 1:
+        try:
+            # All frames are quantized and packed at once
+            frames = WEATHER_SCHEMA.pack_payloads(payloads)
+            size = WEATHER_SCHEMA.size
+            METRICS.observe("encode", perf_counter() - start, len(payloads))
+            return [(device_id, frames[i * size:(i + 1) * size]) for i, device_id in enumerate(device_ids)]
+        except Exception:
+            pass  # Encoded one by one to isolate the invalid payload
+    encoded = []
+    for device_id, payload in zip(device_ids, payloads):
+        try:
+            encoded.append((device_id, WEATHER_SCHEMA.encode(payload)))
+        except Exception as e:
+            logging.error(f"Error encoding payload of device {device_id}: {e}")
+    if payloads:
+        METRICS.observe("encode", perf_counter() - start, len(payloads))
+    return encoded
+
+def treat_payloads(entries):
+    """Filter and encode (device_id, payload) pairs, returns the (device_id, frame) pairs to publish."""
+    device_ids, filtered, frames = [], [], []
+    for device_id, payload in entries:
+        logging.debug("Original payload: %s", payload)
+        METRICS.count(device_id)
+        try:
+            start = perf_counter()
+            payload = filter_payload(device_id, payload)
+            filtered_at = perf_counter()
+            METRICS.observe("filter", filtered_at - start)
+            if frame_batcher is not None:
+                frames += frame_batcher.add(device_id, payload)
+                METRICS.observe("encode", perf_counter() - filtered_at)
+            else:
+                device_ids.append(device_id)
+                filtered.append(payload)
+        except Exception as e:
+            logging.error(f"Error processing payload of device {device_id}: {e}")
+    return frames + _encode(device_ids, filtered)
+
+def process_payload(client: Client, device_id, payload):
+    publish_frames(client, treat_payloads([(device_id, payload)]))
+
+def flush_frames(client: Client):
+    if frame_batcher is not None:
+        publish_frames(client, frame_batcher.flush())
+
+def flush_due_frames(client: Client):
+    # Called every FRAME_FLUSH_INTERVAL by the treatment loops
+    if frame_batcher is not None:
+        publish_frames(client, frame_batcher.flush_due())
 
 def on_message(client: Client, _: any, msg: MQTTMessage):
-    logging.info(f"Received message on topic: {msg.topic}")
+    # Per-message INFO lines are sampled, they would cost more than the treatment
+    sampled = METRICS.sample()
+    if sampled:
+        logging.info("Received message on topic: %s (1 logged every %d)", msg.topic, LOG_SAMPLE_EVERY)
     try:
-        device_id = msg.topic.split("/")[2]
-        payload = json.loads(msg.payload.decode())
-        logging.debug(f"Original payload: {payload}")
-
-        # Apply preprocessing steps
-        payload = mean_payload(device_id, payload)
-        payload = payload_to_discrete(payload)
-        payload = payload_to_bytes(payload)
-
-        logging.debug(f"Pretreated payload: {payload}")
-        client.publish(f"sensors/meteo/{device_id}/raw", payload)
-        logging.info(f"Published pretreated data for device {device_id}")
+        entries = message_payloads(msg.topic, msg.payload)
+        publish_frames(client, treat_payloads(entries))
+        if sampled:
+            logging.info("Published pretreated data for device %s", entries[0][0])
     except Exception as e:
         logging.error(f"Error processing message: {e}")
+
+def on_batch_message(client: Client, _: any, msg: MQTTMessage):
+    try:
+        entries = message_payloads(msg.topic, msg.payload)
+    except Exception as e:
+        logging.error(f"Error decoding batch: {e}")
+        return
+    frames = treat_payloads(entries)
+    publish_frames(client, frames)
+    logging.info(f"Published {len(frames)} pretreated frame(s) for {len(entries)} devices of batch")
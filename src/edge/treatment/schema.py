@@ -0,0 +1,186 @@
+"""
+Declarative layout of the LoRa weather frame, the single source of truth of
+the edge encoder. The fog pre-treatment parser (src/fog/pre-treatment/src/parser.rs)
+reads the same big-endian fields in the same order.
+
+A physical value v is sent as round((v + offset) / step), clamped to the
+range of its wire type, and decoded as wire * step - offset.
+
+Consecutive readings of one device can also be sent as a multi-record frame:
+
+    version   u8        FRAME_VERSION
+    key       (wire)    first field of the schema (device_id), shared by all records
+    count     u8        number of records
+    record 0  (wire)    the other fields, fixed width as in a single frame
+    record i  varints   zigzag delta of each of these fields to record i - 1
+
+A multi-record frame is always longer than a single frame, which is how the
+parser tells them apart.
+"""
+import struct
+from dataclasses import dataclass
+import numpy as np
+
+# struct format character -> (numpy dtype, min, max)
+WIRE_TYPES = {
+    "B": (">u1", 0, 255),
+    "H": (">u2", 0, 65535),
+    "h": (">i2", -32768, 32767),
+    "I": (">u4", 0, 4294967295),
+}
+
+FRAME_VERSION = 2
+MAX_FRAME_RECORDS = 255
+
+
+def _zigzag_varint(value, out):
+    value = value * 2 if value >= 0 else -value * 2 - 1
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(frame, pos):
+    value = shift = 0
+    while True:
+        byte = frame[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return (value >> 1) ^ -(value & 1), pos
+
+
+@dataclass(frozen=True)
+class Field:
+    path: str  # key in the JSON payload, "metadata.<key>" for metadata fields
+    wire: str  # struct format character
+    step: float = 1.0
+    offset: float = 0.0
+
+    @property
+    def name(self):
+        return self.path.rsplit(".", 1)[-1]
+
+
+class Schema:
+    """
+    Compiled once: a struct.Struct for single payloads and a numpy structured
+    dtype with the same layout to pack and unpack batches of readings.
+    """
+
+    def __init__(self, fields):
+        self.fields = tuple(fields)
+        self.struct = struct.Struct(">" + "".join(f.wire for f in self.fields))
+        self.size = self.struct.size
+        self.dtype = np.dtype([(f.name, WIRE_TYPES[f.wire][0]) for f in self.fields])
+        assert self.dtype.itemsize == self.size
+        self.frame_header = struct.Struct(">B" + self.fields[0].wire + "B")
+        self.record = struct.Struct(">" + "".join(f.wire for f in self.fields[1:]))
+        # (metadata?, key, offset, step, min, max) per field, in frame order
+        self._plan = tuple(
+            (f.path.startswith("metadata."), f.name, f.offset, f.step, *WIRE_TYPES[f.wire][1:])
+            for f in self.fields
+        )
+
+    def quantize(self, payload):
+        """Wire integers of a payload, in frame order."""
+        metadata = payload["metadata"]
+        return [
+            max(lo, min(hi, round(((metadata if in_metadata else payload)[key] + offset) / step)))
+            for in_metadata, key, offset, step, lo, hi in self._plan
+        ]
+
+    def encode(self, payload):
+        return self.struct.pack(*self.quantize(payload))
+
+    def decode(self, frame):
+        return self._payload(self.struct.unpack(frame))
+
+    def _payload(self, values):
+        payload = {"metadata": {}}
+        for (in_metadata, key, offset, step, _, _), value in zip(self._plan, values):
+            (payload["metadata"] if in_metadata else payload)[key] = value * step - offset
+        return payload
+
+    def encode_frame(self, payloads):
+        """One multi-record frame holding consecutive payloads of the same key."""
+        return self.pack_frame([self.quantize(payload) for payload in payloads])
+
+    def pack_frame(self, rows):
+        """Multi-record frame of quantized rows (see quantize)."""
+        if not 0 < len(rows) <= MAX_FRAME_RECORDS:
+            raise ValueError(f"A frame holds 1 to {MAX_FRAME_RECORDS} records, not {len(rows)}")
+        key = rows[0][0]
+        if any(row[0] != key for row in rows):
+            raise ValueError("All records of a frame must share the same key")
+        out = bytearray(self.frame_header.pack(FRAME_VERSION, key, len(rows)))
+        out += self.record.pack(*rows[0][1:])
+        for previous, row in zip(rows, rows[1:]):
+            for before, value in zip(previous[1:], row[1:]):
+                _zigzag_varint(value - before, out)
+        return bytes(out)
+
+    def decode_frame(self, frame):
+        """Payloads of a single or a multi-record frame."""
+        if len(frame) == self.size:
+            return [self.decode(frame)]
+        version, key, count = self.frame_header.unpack_from(frame)
+        if version != FRAME_VERSION:
+            raise ValueError(f"Unsupported frame version {version}")
+        pos = self.frame_header.size
+        row = list(self.record.unpack_from(frame, pos))
+        pos += self.record.size
+        payloads = [self._payload([key, *row])]
+        for _ in range(count - 1):
+            for i in range(len(row)):
+                delta, pos = _read_varint(frame, pos)
+                row[i] += delta
+            payloads.append(self._payload([key, *row]))
+        if pos != len(frame):
+            raise ValueError("Trailing bytes after the last record")
+        return payloads
+
+    def pack(self, columns):
+        """
+        Frames of a batch as one bytes object of len(batch) * size bytes.
+        columns maps each field name to an array of physical values.
+        """
+        n = len(next(iter(columns.values())))
+        frames = np.empty(n, dtype=self.dtype)
+        for _, key, offset, step, lo, hi in self._plan:
+            values = (np.asarray(columns[key], dtype=np.float64) + offset) / step
+            # Rejected like quantize does, clip would turn them into arbitrary wire integers
+            if not np.isfinite(values).all():
+                raise ValueError(f"Non-finite {key} in batch")
+            frames[key] = np.clip(np.rint(values), lo, hi)
+        return frames.tobytes()
+
+    def pack_payloads(self, payloads):
+        columns = {
+            key: [(p["metadata"] if in_metadata else p)[key] for p in payloads]
+            for in_metadata, key, *_ in self._plan
+        }
+        return self.pack(columns)
+
+    def unpack(self, data):
+        """Physical columns of a buffer of concatenated frames."""
+        frames = np.frombuffer(data, dtype=self.dtype)
+        return {key: frames[key] * step - offset for _, key, offset, step, _, _ in self._plan}
+
+
+WEATHER_SCHEMA = Schema([
+    Field("metadata.device_id", "H"),
+    Field("metadata.timestamp", "I"),
+    Field("metadata.battery_voltage", "H", step=0.01),
+    Field("metadata.statut_bits", "B"),
+    Field("temperature", "h", step=0.25, offset=20.0),
+    Field("air_humidity", "B"),
+    Field("soil_humidity", "B"),
+    Field("air_pressure", "H", step=0.1),
+    Field("rain", "H", step=0.2),
+    Field("wind_speed", "B", step=0.2),
+    Field("wind_direction", "H", step=0.5),
+])
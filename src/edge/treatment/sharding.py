@@ -0,0 +1,132 @@
+import logging
+import multiprocessing
+import os
+import queue as queues
+import signal
+import time
+import zlib
+import paho.mqtt.client as mqtt
+
+from frames import FRAME_FLUSH_INTERVAL
+from metrics import METRICS_INTERVAL, publish_stats
+from process import BATCH_TOPIC, flush_due_frames, flush_frames, message_payloads, publish_frames, treat_payloads
+
+# Devices are hashed into SHARD_SLOTS slots, and slots spread over the workers. The
+# simulation splits its batches per slot (BATCH_SLOTS, same value) on BATCH_TOPIC/<slot>,
+# which are routed to their worker as raw bytes
+SHARD_SLOTS = int(os.getenv("SHARD_SLOTS", "64"))
+
+# Seconds between two warnings about messages dropped on full worker queues
+DROP_LOG_INTERVAL = 10
+
+
+def slot_of(device_id, slots=SHARD_SLOTS):
+    # Stable across processes and runs, unlike hash()
+    return zlib.crc32(str(device_id).encode()) % slots
+
+
+def shard_of(device_id, shards):
+    return slot_of(device_id) % shards
+
+
+def _worker(shard, shards, queue, broker, port, keep_alive):
+    # Ctrl-C reaches the whole process group, the parent stops workers through their queue
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    client.connect(broker, port, keep_alive)
+    client.loop_start()
+    logging.info(f"Treatment worker {shard}/{shards} connected")
+    if METRICS_INTERVAL > 0:
+        publish_stats(client, f"worker-{shard}")
+
+    while True:
+        try:
+            message = queue.get(timeout=FRAME_FLUSH_INTERVAL)
+        except queues.Empty:
+            # Idle: the partial frames of quiet devices still leave on time
+            flush_due_frames(client)
+            continue
+        if message is None:
+            break
+        topic, data = message
+        try:
+            entries = message_payloads(topic, data)
+            if topic == BATCH_TOPIC:
+                # Unsplit batches go to every worker, each treats the devices of its shard
+                entries = [entry for entry in entries if shard_of(entry[0], shards) == shard]
+            publish_frames(client, treat_payloads(entries))
+        except Exception as e:
+            logging.error(f"Worker {shard}: error processing message on {topic}: {e}")
+
+    flush_frames(client)
+    client.loop_stop()
+    client.disconnect()
+
+
+class ShardedPool:
+    """
+    Treatment spread over worker processes. Each worker owns the devices
+    whose crc32(device_id) falls in its shard: their filter windows and
+    pending frames live in that process only, and its single ingest queue
+    keeps the messages of a device in order. The MQTT network thread only
+    routes raw messages: a reading by the slot of its device id, a batch of
+    one slot (BATCH_TOPIC/<slot>) to the worker of that slot, so batches are
+    decoded in parallel. Unsplit batches are sent to every worker. When a
+    worker falls behind, its bounded queue makes the network thread wait up
+    to `put_timeout` seconds, then the message is dropped for that worker
+    so keepalives still go out.
+    """
+
+    def __init__(self, workers, broker, port, keep_alive, queue_size=10000, put_timeout=1.0):
+        # Forked before the MQTT client of the parent exists
+        context = multiprocessing.get_context("fork")
+        self.queues = [context.Queue(queue_size) for _ in range(workers)]
+        self.processes = [
+            context.Process(target=_worker, args=(shard, workers, queue, broker, port, keep_alive), daemon=True)
+            for shard, queue in enumerate(self.queues)
+        ]
+        self.put_timeout = put_timeout
+        self.dropped = 0
+        self._last_warning = 0.0
+        self.warned_unsplit = False
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def stop(self, timeout=5):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join(timeout)
+
+    def _put(self, shard, message):
+        try:
+            self.queues[shard].put(message, timeout=self.put_timeout)
+        except queues.Full:
+            self.dropped += 1
+            now = time.monotonic()
+            if now - self._last_warning >= DROP_LOG_INTERVAL:
+                self._last_warning = now
+                logging.warning(f"Treatment worker {shard} is full: {self.dropped} message(s) dropped so far")
+
+    def on_message(self, client, _, msg):
+        device_id = msg.topic.split("/")[2]
+        self._put(shard_of(device_id, len(self.queues)), (msg.topic, msg.payload))
+
+    def on_batch_message(self, client, _, msg):
+        if msg.topic == BATCH_TOPIC:
+            if not self.warned_unsplit:
+                self.warned_unsplit = True
+                logging.warning(
+                    f"Unsplit batches are decoded by every worker, set BATCH_SLOTS={SHARD_SLOTS} on the simulation"
+                )
+            for shard in range(len(self.queues)):
+                self._put(shard, (msg.topic, msg.payload))
+            return
+        try:
+            slot = int(msg.topic.rsplit("/", 1)[1])
+        except ValueError:
+            logging.error(f"Batch topic without a slot: {msg.topic}")
+            return
+        self._put(slot % len(self.queues), (msg.topic, msg.payload))
@@ -0,0 +1,29 @@
+import math
+import pytest
+from schema import WEATHER_SCHEMA
+
+
+def reading(temperature=21.5):
+    return {
+        "metadata": {"device_id": 7, "timestamp": 1700000000, "battery_voltage": 3.7, "statut_bits": 0},
+        "temperature": temperature,
+        "air_humidity": 50.0,
+        "soil_humidity": 30.0,
+        "air_pressure": 1013.2,
+        "rain": 0.0,
+        "wind_speed": 3.0,
+        "wind_direction": 90.0,
+    }
+
+
+def test_batch_matches_single_encoding():
+    payloads = [reading(), reading(-3.25)]
+    assert WEATHER_SCHEMA.pack_payloads(payloads) == b"".join(WEATHER_SCHEMA.encode(p) for p in payloads)
+
+
+@pytest.mark.parametrize("value", [math.nan, math.inf, -math.inf])
+def test_non_finite_rejected_by_both_paths(value):
+    with pytest.raises((ValueError, OverflowError)):
+        WEATHER_SCHEMA.encode(reading(value))
+    with pytest.raises(ValueError):
+        WEATHER_SCHEMA.pack_payloads([reading(), reading(value)])
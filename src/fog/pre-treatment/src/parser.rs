@@ -1,11 +1,46 @@
+//! Parser of the LoRa weather frame. The layout is declared once on the edge,
+//! in `src/edge/treatment/schema.py` (`WEATHER_SCHEMA`), and must stay in sync:
+//!
+//! | field           | type | step                  |
+//! |-----------------|------|-----------------------|
+//! | device_id       | u16  |                       |
+//! | timestamp       | u32  | 1 s                   |
+//! | battery_voltage | u16  | 10 mV                 |
+//! | status_bits     | u8   |                       |
+//! | temperature     | i16  | 0.25 °C, offset 20 °C |
+//! | air_humidity    | u8   | 1 %                   |
+//! | soil_humidity   | u8   | 1 %                   |
+//! | air_pressure    | u16  | 0.1 hPa               |
+//! | rain            | u16  | 0.2 mm                |
+//! | wind_speed      | u8   | 0.2 m/s               |
+//! | wind_direction  | u16  | 0.5 °                 |
+//!
+//! All fields are big-endian, 20 bytes per frame.
+//!
+//! Multi-record frames carry consecutive readings of one device:
+//!
+//! | part     | encoding                                                    |
+//! |----------|-------------------------------------------------------------|
+//! | version  | u8, `WEATHER_FRAME_VERSION`                                 |
+//! | device   | u16                                                         |
+//! | count    | u8, number of records                                       |
+//! | record 0 | the fields after device_id, as in a single frame            |
+//! | record i | zigzag varint delta of each of these fields to record i - 1 |
+//!
+//! They are never 20 bytes long, single frames have no version byte.
 use crate::raw_messages::*;
 use nom::{
+    error::{Error, ErrorKind},
     number::complete::{be_i16, be_u16, be_u32, be_u8},
     IResult,
 };
 
-fn parse_metadata_i(input: &[u8]) -> IResult<&[u8], RawMetadata> {
-    let (input, device_id) = be_u16(input)?;
+/// Size of a single-record frame
+pub const WEATHER_FRAME_SIZE: usize = 20;
+/// Version byte of multi-record frames
+pub const WEATHER_FRAME_VERSION: u8 = 2;
+
+fn parse_metadata_i(input: &[u8], device_id: u16) -> IResult<&[u8], RawMetadata> {
     let (input, timestamp) = be_u32(input)?;
     let (input, battery_voltage) = be_u16(input)?;
     let (input, status_bits) = be_u8(input)?;
@@ -20,8 +55,8 @@ fn parse_metadata_i(input: &[u8]) -> IResult<&[u8], RawMetadata> {
     ))
 }
 
-fn parse_weather_i(input: &[u8]) -> IResult<&[u8], RawWeatherData> {
-    let (input, metadata) = parse_metadata_i(input)?;
+fn parse_record_i(input: &[u8], device_id: u16) -> IResult<&[u8], RawWeatherData> {
+    let (input, metadata) = parse_metadata_i(input, device_id)?;
     let (input, temperature) = be_i16(input)?;
     let (input, air_humidity) = be_u8(input)?;
     let (input, soil_humidity) = be_u8(input)?;
@@ -44,9 +79,152 @@ fn parse_weather_i(input: &[u8]) -> IResult<&[u8], RawWeatherData> {
     ))
 }
 
+fn parse_weather_i(input: &[u8]) -> IResult<&[u8], RawWeatherData> {
+    let (input, device_id) = be_u16(input)?;
+    parse_record_i(input, device_id)
+}
+
+fn zigzag_varint_i(mut input: &[u8]) -> IResult<&[u8], i64> {
+    let mut value: u64 = 0;
+    let mut shift = 0;
+    loop {
+        let (rest, byte) = be_u8(input)?;
+        if shift > 63 {
+            return Err(nom::Err::Error(Error::new(input, ErrorKind::TooLarge)));
+        }
+        value |= ((byte & 0x7f) as u64) << shift;
+        input = rest;
+        if byte & 0x80 == 0 {
+            break;
+        }
+        shift += 7;
+    }
+    Ok((input, (value >> 1) as i64 ^ -((value & 1) as i64)))
+}
+
+/// Next value of a field from its varint delta, rejecting values outside of its type
+fn delta_i<T: Copy + Into<i64> + TryFrom<i64>>(input: &[u8], previous: T) -> IResult<&[u8], T> {
+    let (rest, delta) = zigzag_varint_i(input)?;
+    let value = previous
+        .into()
+        .checked_add(delta)
+        .and_then(|value| T::try_from(value).ok())
+        .ok_or(nom::Err::Error(Error::new(input, ErrorKind::Verify)))?;
+    Ok((rest, value))
+}
+
+fn parse_delta_record_i<'a>(
+    input: &'a [u8],
+    previous: &RawWeatherData,
+) -> IResult<&'a [u8], RawWeatherData> {
+    let (input, timestamp) = delta_i(input, previous.metadata.timestamp)?;
+    let (input, battery_voltage) = delta_i(input, previous.metadata.battery_voltage)?;
+    let (input, status_bits) = delta_i(input, previous.metadata.status_bits)?;
+    let (input, temperature) = delta_i(input, previous.temperature)?;
+    let (input, air_humidity) = delta_i(input, previous.air_humidity)?;
+    let (input, soil_humidity) = delta_i(input, previous.soil_humidity)?;
+    let (input, air_pressure) = delta_i(input, previous.air_pressure)?;
+    let (input, rain) = delta_i(input, previous.rain)?;
+    let (input, wind_speed) = delta_i(input, previous.wind_speed)?;
+    let (input, wind_direction) = delta_i(input, previous.wind_direction)?;
+    Ok((
+        input,
+        RawWeatherData {
+            metadata: RawMetadata {
+                device_id: previous.metadata.device_id,
+                timestamp,
+                battery_voltage,
+                status_bits,
+            },
+            temperature,
+            air_humidity,
+            soil_humidity,
+            air_pressure,
+            rain,
+            wind_speed,
+            wind_direction,
+        },
+    ))
+}
+
+fn parse_multi_record_i(input: &[u8]) -> IResult<&[u8], Vec<RawWeatherData>> {
+    let (input, version) = be_u8(input)?;
+    if version != WEATHER_FRAME_VERSION {
+        return Err(nom::Err::Error(Error::new(input, ErrorKind::Tag)));
+    }
+    let (input, device_id) = be_u16(input)?;
+    let (input, count) = be_u8(input)?;
+    if count == 0 {
+        return Err(nom::Err::Error(Error::new(input, ErrorKind::Verify)));
+    }
+    let (mut input, first) = parse_record_i(input, device_id)?;
+    let mut records = Vec::with_capacity(count as usize);
+    records.push(first);
+    for _ in 1..count {
+        let (rest, record) = parse_delta_record_i(input, &records[records.len() - 1])?;
+        records.push(record);
+        input = rest;
+    }
+    if !input.is_empty() {
+        return Err(nom::Err::Error(Error::new(input, ErrorKind::Eof)));
+    }
+    Ok((input, records))
+}
+
+/// Records of a single (legacy) or multi-record frame
+pub fn parse_weather_frame(
+    data: &[u8],
+) -> Result<Vec<RawWeatherData>, nom::Err<nom::error::Error<&[u8]>>> {
+    if data.len() == WEATHER_FRAME_SIZE {
+        return parse_weather_data(data).map(|weather| vec![weather]);
+    }
+    match parse_multi_record_i(data) {
+        Ok((_, records)) => Ok(records),
+        Err(err) => Err(err),
+    }
+}
+
 pub fn parse_weather_data(data: &[u8]) -> Result<RawWeatherData, nom::Err<nom::error::Error<&[u8]>>> {
     match parse_weather_i(data) {
         Ok((_, weather)) => Ok(weather),
         Err(err) => Err(err),
     }
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_parse_multi_record_frame() {
+        // Three readings of device 50, encoded by WEATHER_SCHEMA.encode_frame on the edge
+        let bytes: [u8; 43] = [
+            0x02, // version
+            0x00, 0x32, // device_id
+            0x03, // count
+            0x69, 0x05, 0x4d, 0x80, 0x01, 0x68, 0x00, 0x00, 0xa2, 0x3c, 0x1e, 0x27, 0x94, 0x00,
+            0x0a, 0x10, 0x01, 0x68, // record 0
+            0x78, 0x00, 0x00, 0x05, 0x00, 0x00, 0x00, 0x13, 0x00, 0xce, 0x05, // record 1 deltas
+            0x78, 0x01, 0x00, 0x00, 0x00, 0x00, 0x03, 0x00, 0x00, 0x00, // record 2 deltas
+        ];
+
+        let records = parse_weather_frame(&bytes).expect("Parsing should succeed");
+
+        assert_eq!(records.len(), 3, "Record count should match");
+        assert!(records.iter().all(|r| r.metadata.device_id == 50), "Device ID should match");
+        assert_eq!(records[0].metadata.timestamp, 1761955200, "Timestamp should match");
+        assert_eq!(records[2].metadata.timestamp, 1761955320, "Timestamp should match");
+        assert_eq!(records[2].metadata.battery_voltage, 359, "Battery voltage should match");
+        assert_eq!(records[1].temperature, 159, "Temperature should match");
+        assert_eq!(records[1].rain, 0, "Rain should match");
+        assert_eq!(records[1].wind_direction, 719, "Wind direction should match");
+        assert_eq!(records[2].air_pressure, 10130, "Air pressure should match");
+
+        // Single frames are still parsed on their own
+        let single = parse_weather_frame(&[&bytes[1..3], &bytes[4..22]].concat()).expect("Parsing should succeed");
+        assert_eq!(single.len(), 1, "Record count should match");
+        assert_eq!(single[0].air_pressure, 10132, "Air pressure should match");
+
+        assert!(parse_weather_frame(&bytes[..42]).is_err(), "Truncated frame should fail");
+    }
+}
@@ -13,16 +13,16 @@ use rdkafka::Message;
 use rust_shared::redpanda_utils;
 use strfmt::strfmt;
 
-use crate::parser::parse_weather_data;
+use crate::parser::parse_weather_frame;
 use crate::process::process_weather_data;
 use crate::station_config::StationConfig;
 
-// Process weather data message
+// Process weather data message, a frame holds one or several records of the same device
 async fn process_message(
     msg: OwnedMessage,
     minio_client: &MinioClient,
     minio_bucket: &str,
-) -> Result<(u16, String), String> {
+) -> Result<Vec<(u16, String)>, String> {
     info!("Processing message at offset {}", msg.offset());
 
     // Extract payload as byte array
@@ -30,30 +30,28 @@ async fn process_message(
         .payload()
         .ok_or_else(|| "No payload in message".to_string())?;
 
-    // Parse payload as RawWeatherData
-    let raw_weather_data =
-        parse_weather_data(payload).map_err(|e| format!("Failed to parse weather data: {}", e))?;
+    // Parse payload as RawWeatherData records
+    let raw_records =
+        parse_weather_frame(payload).map_err(|e| format!("Failed to parse weather data: {}", e))?;
+    let device_id = raw_records[0].metadata.device_id;
 
-    // Fetch station config from MinIO
+    // Fetch station config from MinIO, once per frame
     let station_config_bytes = minio_client
-        .get_object(
-            minio_bucket,
-            format!("{}.json", raw_weather_data.metadata.device_id),
-        )
+        .get_object(minio_bucket, format!("{}.json", device_id))
         .build()
         .send()
         .await
         .map_err(|e| {
             format!(
                 "Failed to fetch station ({}) config from MinIO: {}",
-                raw_weather_data.metadata.device_id, e
+                device_id, e
             )
         })?
         .content()
         .map_err(|e| {
             format!(
                 "Failed to read station ({}) config content: {}",
-                raw_weather_data.metadata.device_id, e
+                device_id, e
             )
         })?
         .to_segmented_bytes()
@@ -61,7 +59,7 @@ async fn process_message(
         .map_err(|e| {
             format!(
                 "Failed to convert station ({}) config to bytes: {}",
-                raw_weather_data.metadata.device_id, e
+                device_id, e
             )
         })?
         .to_bytes();
@@ -69,23 +67,28 @@ async fn process_message(
         serde_json::from_slice(&station_config_bytes).map_err(|e| {
             format!(
                 "Failed to parse station ({}) config JSON: {}",
-                raw_weather_data.metadata.device_id, e
+                device_id, e
             )
         })?;
 
-    // Process and convert to WeatherData
-    let weather_data = process_weather_data(raw_weather_data, &station_config)
-        .map_err(|e| format!("Failed to process weather data: {}", e))?;
+    let mut messages = Vec::with_capacity(raw_records.len());
+    for raw_weather_data in raw_records {
+        // Process and convert to WeatherData
+        let weather_data = process_weather_data(raw_weather_data, &station_config)
+            .map_err(|e| format!("Failed to process weather data: {}", e))?;
 
-    // Serialize to JSON for publishing
-    let json =
-        serde_json::to_string(&weather_data).map_err(|e| format!("Failed to serialize: {}", e))?;
+        // Serialize to JSON for publishing
+        let json = serde_json::to_string(&weather_data)
+            .map_err(|e| format!("Failed to serialize: {}", e))?;
+        messages.push((weather_data.metadata.device_id, json));
+    }
 
     info!(
-        "Successfully processed message from device {}",
-        weather_data.metadata.device_id
+        "Successfully processed {} record(s) from device {}",
+        messages.len(),
+        device_id
     );
-    Ok((weather_data.metadata.device_id, json))
+    Ok(messages)
 }
 
 pub async fn run_async_processor(
@@ -115,23 +118,25 @@ pub async fn run_async_processor(
             let minio_bucket = minio_bucket.clone();
             async move {
                 match process_message(msg, &*minio_client, &minio_bucket).await {
-                    Ok(json_payload) => {
-                        let mut vars: std::collections::HashMap<String, String> =
-                            std::collections::HashMap::new();
-                        vars.insert("device_id".to_string(), json_payload.0.to_string());
-
-                        if let Ok(topic_name) = strfmt(&output_topic, &vars) {
-                            let produce_future = producer.send(
-                                FutureRecord::<(), [u8]>::to(topic_name.as_str())
-                                    .payload(json_payload.1.as_bytes()),
-                                Duration::from_secs(5),
-                            );
-                            match produce_future.await {
-                                Ok(delivery) => info!("Published message: {:?}", delivery),
-                                Err((e, _)) => error!("Failed to publish message: {:?}", e),
+                    Ok(json_payloads) => {
+                        for json_payload in json_payloads {
+                            let mut vars: std::collections::HashMap<String, String> =
+                                std::collections::HashMap::new();
+                            vars.insert("device_id".to_string(), json_payload.0.to_string());
+
+                            if let Ok(topic_name) = strfmt(&output_topic, &vars) {
+                                let produce_future = producer.send(
+                                    FutureRecord::<(), [u8]>::to(topic_name.as_str())
+                                        .payload(json_payload.1.as_bytes()),
+                                    Duration::from_secs(5),
+                                );
+                                match produce_future.await {
+                                    Ok(delivery) => info!("Published message: {:?}", delivery),
+                                    Err((e, _)) => error!("Failed to publish message: {:?}", e),
+                                }
+                            } else {
+                                error!("Failed to format output topic string: {}", output_topic);
                             }
-                        } else {
-                            error!("Failed to format output topic string: {}", output_topic);
                         }
                     }
                     Err(e) => error!("Failed to process message logic: {}", e),
@@ -0,0 +1,92 @@
+"""
+Whole-grid fire spread forecast. Realisations are stacked on a leading
+ensemble axis so that N of them run as one batched computation.
+"""
+import numpy as np
+
+# (dr, dc) offsets of the 8 neighbours a burning cell spreads to
+NEIGHBOURS = [(dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if (dr, dc) != (0, 0)]
+# Realisations computed together, bounds the memory of large ensembles
+ENSEMBLE_CHUNK = 64
+
+
+def shifted_slices(dr, dc, size):
+    """(target, source) indices pairing each cell with its neighbour at (-dr, -dc)."""
+    def axis(d):
+        return slice(max(d, 0), size + min(d, 0)), slice(max(-d, 0), size + min(-d, 0))
+
+    (rows, src_rows), (cols, src_cols) = axis(dr), axis(dc)
+    return (..., rows, cols), (..., src_rows, src_cols)
+
+
+def propagation_probabilities(weather_data, size):
+    """
+    Probability that a burning neighbour ignites each cell, for each of the
+    NEIGHBOURS directions: shape (8, size, size), from the weather of the cell.
+    """
+    T = weather_data['temperature']
+    H = weather_data['air_humidity']
+    Ws = weather_data['wind_speed']
+    Wd = weather_data['wind_direction']
+
+    dryness = (T / 40.0) + (1.0 - (H / 100.0))
+    wind = np.where(Ws > 0, Ws / 30.0, 0.0)
+    # cos(Wd - angle) = cos(Wd) cos(angle) + sin(Wd) sin(angle), one sin/cos per cell
+    wind_cos = wind * np.cos(np.radians(Wd))
+    wind_sin = wind * np.sin(np.radians(Wd))
+
+    probabilities = np.empty((len(NEIGHBOURS), size, size), dtype=np.float32)
+    for probability, (dr, dc) in zip(probabilities, NEIGHBOURS):
+        # Direction from the burning neighbour to the cell
+        angle = np.arctan2(dr, dc)
+        np.clip((0.1 * dryness) + wind_cos * np.cos(angle) + wind_sin * np.sin(angle), 0.0, 1.0, out=probability)
+    return probabilities
+
+
+def spread_fire(seed_grid, probabilities, steps, rng, members=1):
+    """
+    Burning cells after `steps`, shape (members, size, size), starting from
+    the cells of seed_grid >= 0.5. A cell ignites unless every burning
+    neighbour fails to ignite it, with one random draw per cell and step.
+    """
+    size = seed_grid.shape[-1]
+    burning = np.broadcast_to(seed_grid >= 0.5, (members, *seed_grid.shape)).copy()
+    spreading, no_ignition, factor, draw = (np.empty(burning.shape, dtype=np.float32) for _ in range(4))
+    slices = [shifted_slices(dr, dc, size) for dr, dc in NEIGHBOURS]
+    for _ in range(steps):
+        np.copyto(spreading, burning)
+        no_ignition.fill(1.0)
+        for probability, (target, source) in zip(probabilities, slices):
+            f = factor[target]
+            np.multiply(probability[target], spreading[source], out=f)
+            np.subtract(1.0, f, out=f)
+            no_ignition[target] *= f
+        rng.random(dtype=np.float32, out=draw)
+        burning |= draw < 1.0 - no_ignition
+    return burning
+
+
+def ignition_counts(seed_grid, probabilities, steps, members, seed):
+    """Number of realisations in which each cell burns at the horizon."""
+    rng = np.random.default_rng(seed)
+    counts = np.zeros(seed_grid.shape, dtype=np.int32)
+    for start in range(0, members, ENSEMBLE_CHUNK):
+        counts += spread_fire(seed_grid, probabilities, steps, rng, min(ENSEMBLE_CHUNK, members - start)).sum(axis=0)
+    return counts
+
+
+def ignition_probability(seed_grid, probabilities, steps, members, rng, pool=None, workers=1):
+    """
+    Fraction of `members` realisations in which each cell burns at the
+    horizon, the realisations split over the `workers` of a
+    multiprocessing `pool` if given.
+    """
+    if pool is None or workers < 2 or members < 2 * workers:
+        return ignition_counts(seed_grid, probabilities, steps, members, rng) / members
+    shares = [members // workers + (i < members % workers) for i in range(workers)]
+    seeds = np.random.SeedSequence(rng.integers(2**63)).spawn(workers)
+    results = [
+        pool.apply_async(ignition_counts, (seed_grid, probabilities, steps, share, seed))
+        for share, seed in zip(shares, seeds)
+    ]
+    return sum(result.get() for result in results) / members
@@ -9,7 +9,6 @@ import matplotlib.animation as animation
 import json
 from kafka import KafkaConsumer, KafkaProducer
 from kafka.errors import KafkaError
-import random
 import threading
 import time
 import re
@@ -17,19 +16,43 @@ import os
 import datetime
 from PIL import Image
 import io
+import multiprocessing
+from forecast import ignition_probability, propagation_probabilities, spread_fire
+from satellite_feed import SatelliteFeedDecoder
 
 REDPANDA_BROKER = os.getenv("REDPANDA_BROKER", "localhost:19092")
 PLOT = os.getenv("PLOT", "True").lower() == "true"
 
-GRID_SIZE = 64
+GRID_SIZE = int(os.getenv("GRID_SIZE", "64"))
 PREDICTION_STEPS = 10
 FIRE_THRESHOLD = 60.0
+# Cells whose predicted ignition probability reaches it are at risk
+RISK_THRESHOLD = float(os.getenv("RISK_THRESHOLD", "0.5"))
+# Lowest ignition probability published on the risk map
+PROBABILITY_FLOOR = float(os.getenv("PROBABILITY_FLOOR", "0.01"))
+
+# Seconds between two simulation steps (prediction and risk map)
+CYCLE_PERIOD = float(os.getenv("CYCLE_PERIOD", "0.5" if PLOT else "1.0"))
+# Ensemble forecast: up to ENSEMBLE_MAX realisations per cycle (0 runs a single one),
+# as many as fit in what is left of the first FORECAST_SHARE of the cycle once the
+# weather is updated, at least ENSEMBLE_MIN (capped to ENSEMBLE_MAX)
+ENSEMBLE_MAX = int(os.getenv("ENSEMBLE_MAX", "0"))
+ENSEMBLE_MIN = max(1, min(int(os.getenv("ENSEMBLE_MIN", "8")), ENSEMBLE_MAX))
+FORECAST_SHARE = float(os.getenv("FORECAST_SHARE", "0.5"))
+# Worker processes sharing the realisations, 0 runs them in this process
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", "0"))
 
 # Satellite readjustment configuration
 SATELLITE_WEIGHT = 0.7  # Weight for satellite data in readjustment
 METEO_WEIGHT = 0.3      # Weight for meteo station data
 SATELLITE_UPDATE_THRESHOLD = 5.0  # seconds between satellite updates
 
+# Forked now, before the Kafka producer and consumers start their threads:
+# forking a threaded process can deadlock, and spawned workers would re-run this module
+forecast_pool = None
+if ENSEMBLE_MAX > 0 and FORECAST_WORKERS > 1:
+    forecast_pool = multiprocessing.get_context("fork").Pool(FORECAST_WORKERS)
+
 def json_serializer(data):
     return json.dumps(data).encode("utf-8")
 
@@ -122,7 +145,7 @@ STATE_BURNING = 2
 STATE_BURNT = 3
 
 class FirePredictor:
-    def __init__(self, size=50):
+    def __init__(self, size=50, pool=None):
         self.size = size
         self.min_lat, self.max_lat = 0, 0
         self.min_lon, self.max_lon = 0, 0
@@ -144,6 +167,13 @@ class FirePredictor:
 
         self.satellite_bbox = None  # (min_lon, min_lat, max_lon, max_lat)
 
+        self.rng = np.random.default_rng()
+        # Seconds per realisation, measured on the previous cycles
+        self.member_cost = None
+        self.ensemble_size = 0
+        # Workers running the realisations of forecast.py, None runs them in this process
+        self.pool = pool
+
     def _get_biggest_bbox(self, station_bbox, satellite_bbox):
         """
         Return the biggest bbox covering both station and satellite bboxes.
@@ -241,10 +271,19 @@ class FirePredictor:
             
             return True
 
-    def predict_from_meteo(self, steps=3):
+    def _ensemble_size(self, deadline):
+        if deadline is None or self.member_cost is None:
+            return ENSEMBLE_MIN
+        members = int((deadline - time.perf_counter()) / self.member_cost)
+        return max(ENSEMBLE_MIN, min(ENSEMBLE_MAX, members))
+
+    def predict_from_meteo(self, steps=3, deadline=None):
         """
         Fast prediction based on meteo station data.
         Uses temperature thresholds and weather conditions for propagation.
+        With an ensemble, the grid holds the probability of each cell to burn
+        within `steps`, with as many realisations as fit before `deadline`
+        (time.perf_counter() seconds), within ENSEMBLE_MIN..ENSEMBLE_MAX.
         """
         if not self.initialized:
             return
@@ -269,28 +308,25 @@ class FirePredictor:
 
         sim_grid = seed_grid.copy()
 
-        # Propagation simulation
-        for step in range(steps):
-            new_spread = np.zeros_like(sim_grid)
-            rows, cols = np.where(sim_grid >= 0.5)
-
-            for r, c in zip(rows, cols):
-                for dr in [-1, 0, 1]:
-                    for dc in [-1, 0, 1]:
-                        if dr==0 and dc==0:
-                            continue
-                        nr, nc = r+dr, c+dc
-
-                        if 0 <= nr < self.size and 0 <= nc < self.size:
-                            if sim_grid[nr, nc] < 0.5:
-                                prob = self._calculate_propagation_probability(r, c, nr, nc)
-                                if random.random() < prob:
-                                    new_spread[nr, nc] = 1
-            sim_grid = np.maximum(sim_grid, new_spread)
+        spread = propagation_probabilities(self.weather_data, self.size)
+        if ENSEMBLE_MAX > 0:
+            # Probability of burning within the horizon over an ensemble of realisations
+            members = self._ensemble_size(deadline)
+            start = time.perf_counter()
+            self.meteo_prediction_grid = ignition_probability(
+                sim_grid, spread, steps, members, self.rng, self.pool, FORECAST_WORKERS
+            )
+            cost = (time.perf_counter() - start) / members
+            self.member_cost = cost if self.member_cost is None else 0.7 * self.member_cost + 0.3 * cost
+            self.ensemble_size = members
+            return
+
+        # Single realisation
+        sim_grid = np.maximum(sim_grid, spread_fire(sim_grid, spread, steps, self.rng)[0])
 
         self.meteo_prediction_grid = sim_grid
 
-    def calculate_prediction(self, steps=3):
+    def calculate_prediction(self, steps=3, deadline=None):
         """
         Main prediction method combining satellite and meteo data.
         Satellite provides position readjustment, meteo provides high-frequency updates.
@@ -308,7 +344,7 @@ class FirePredictor:
             self.readjust_from_satellite()
         
         # Always run meteo prediction for high-frequency updates
-        self.predict_from_meteo(steps)
+        self.predict_from_meteo(steps, deadline)
         
         # Combine satellite position with meteo prediction
         if self.last_satellite_readjustment > 0:
@@ -319,30 +355,13 @@ class FirePredictor:
             # Burning: satellite says burning (STATE_BURNING)
             combined[self.satellite_fire_grid == STATE_BURNING] = STATE_BURNING
             # At risk: not burnt/burning but meteo predicts fire
-            at_risk = (self.satellite_fire_grid == STATE_VEGETATION) & (self.meteo_prediction_grid >= 0.5)
+            at_risk = (self.satellite_fire_grid == STATE_VEGETATION) & (self.meteo_prediction_grid >= RISK_THRESHOLD)
             combined[at_risk] = STATE_AT_RISK
             self.display_grid = combined
         else:
             # No satellite data yet, use only meteo: at risk (STATE_AT_RISK)
             self.display_grid = np.full_like(self.meteo_prediction_grid, STATE_VEGETATION, dtype=int)
-            self.display_grid[self.meteo_prediction_grid >= 0.5] = STATE_AT_RISK
-
-    def _calculate_propagation_probability(self, r1, c1, r2, c2):
-        """
-        Calculate fire propagation probability based on weather conditions.
-        """
-        wd = self.weather_data
-        T = wd['temperature'][r2, c2]
-        H = wd['air_humidity'][r2, c2]
-        Ws = wd['wind_speed'][r2, c2]
-        Wd = wd['wind_direction'][r2, c2]
-
-        dryness = (T / 40.0) + (1.0 - (H / 100.0))
-        dy, dx = r2 - r1, c2 - c1
-        angle = np.degrees(np.arctan2(dy, dx))
-        wind_factor = (Ws / 30.0) * np.cos(np.radians(Wd - angle)) if Ws > 0 else 0
-
-        return max(0.0, min(1.0, (0.1 * dryness) + wind_factor))
+            self.display_grid[self.meteo_prediction_grid >= RISK_THRESHOLD] = STATE_AT_RISK
 
     # compute global mean wind speed and circular mean wind direction
     def get_global_wind(self):
@@ -381,20 +400,30 @@ class FirePredictor:
         lat_step = (self.max_lat - self.min_lat) / self.size
         lon_step = (self.max_lon - self.min_lon) / self.size
 
-        # Only output cells with value > 0 (at risk, burning, burnt)
-        rows, cols = np.where(self.display_grid > STATE_VEGETATION)
+        # Only output cells with value > 0 (at risk, burning, burnt), and with an ensemble
+        # the vegetation cells whose probability reaches PROBABILITY_FLOOR, so the layer
+        # fades out below RISK_THRESHOLD instead of stopping at it
+        emitted = self.display_grid > STATE_VEGETATION
+        if self.ensemble_size:
+            probability = self.meteo_prediction_grid
+            emitted |= (probability > 0) & (probability >= PROBABILITY_FLOOR)
+        rows, cols = np.where(emitted)
 
         cells_data = []
         for r, c in zip(rows, cols):
             cell_lat = self.min_lat + (r * lat_step)
             cell_lon = self.min_lon + (c * lon_step)
-            value = int(self.display_grid[r, c])  # 3=burnt, 2=burning, 1=at risk
+            value = int(self.display_grid[r, c])  # 3=burnt, 2=burning, 1=at risk, 0=below the risk threshold
 
-            cells_data.append({
+            cell = {
                 "latitude": round(cell_lat, 6),
                 "longitude": round(cell_lon, 6),
                 "value": value
-            })
+            }
+            if self.ensemble_size:
+                # Fraction of the ensemble in which the cell burns within the horizon
+                cell["probability"] = round(float(self.meteo_prediction_grid[r, c]), 3)
+            cells_data.append(cell)
 
         if not cells_data:
             return
@@ -411,6 +440,9 @@ class FirePredictor:
             }
         }
 
+        if self.ensemble_size:
+            payload["ensemble_size"] = self.ensemble_size
+
         # include global wind info if available
         mean_ws, mean_dir = self.get_global_wind()
         if mean_ws is not None and mean_dir is not None:
@@ -436,7 +468,7 @@ class FirePredictor:
             coords.append((px, py))
         return coords
 
-predictor = FirePredictor(size=GRID_SIZE)
+predictor = FirePredictor(size=GRID_SIZE, pool=forecast_pool)
 
 def classify_satellite_pixels(arr):
     """
@@ -467,7 +499,6 @@ def consume_satellite_view():
     Consume satellite imagery for ground truth fire position.
     Satellite updates are less frequent but more accurate for position readjustment.
     """
-    global satellite_grid, last_satellite_update, satellite_bbox
     try:
         consumer = KafkaConsumer(
             'sensors.satellite.view',
@@ -488,23 +519,55 @@ def consume_satellite_view():
                 arr =np.flipud(arr)
                 
                 mask = classify_satellite_pixels(arr)
-                with satellite_lock:
-                    satellite_grid = mask
-                    last_satellite_update = time.time()
-                    bbox = msg.get("bbox", None)
-                    if bbox and isinstance(bbox, list) and len(bbox) == 4:
-                        # bbox: [min_lon, min_lat, max_lon, max_lat]
-                        satellite_bbox = tuple(bbox)
-                fire_px = np.sum(mask==1)
-                burnt_px = np.sum(mask==2)
-                print(f"🛰️  Satellite update: {fire_px} fire pixels, {burnt_px} burnt pixels")
+                bbox = msg.get("bbox", None)
+                if not (bbox and isinstance(bbox, list) and len(bbox) == 4):
+                    bbox = None
+                update_satellite_grid(mask, bbox)
             except Exception as e:
                 print(f"Erreur lecture satellite: {e}")
     except KafkaError as e:
         print(f"Erreur Kafka satellite: {e}")
 
+def update_satellite_grid(mask, bbox):
+    global satellite_grid, last_satellite_update, satellite_bbox
+    with satellite_lock:
+        satellite_grid = mask
+        last_satellite_update = time.time()
+        if bbox is not None:
+            # bbox: [min_lon, min_lat, max_lon, max_lat]
+            satellite_bbox = tuple(bbox)
+    fire_px = np.sum(mask==1)
+    burnt_px = np.sum(mask==2)
+    print(f"🛰️  Satellite update: {fire_px} fire pixels, {burnt_px} burnt pixels")
+
+def consume_satellite_state():
+    """
+    Consume the compact satellite feed: bit-packed state keyframes and delta
+    frames, read straight into the state grid without image decoding.
+    """
+    decoder = SatelliteFeedDecoder()
+    try:
+        consumer = KafkaConsumer(
+            'sensors.satellite.state',
+            bootstrap_servers=[REDPANDA_BROKER],
+            value_deserializer=lambda m: m,
+            auto_offset_reset='latest',
+            group_id='satellite-state-group'
+        )
+        print("✓ Satellite state consumer connected")
+        for message in consumer:
+            try:
+                if decoder.decode(message.value):
+                    update_satellite_grid(decoder.mask(GRID_SIZE), decoder.bbox)
+            except Exception as e:
+                print(f"Erreur lecture satellite (state): {e}")
+    except KafkaError as e:
+        print(f"Erreur Kafka satellite (state): {e}")
+
 sat_thread = threading.Thread(target=consume_satellite_view, daemon=True)
 sat_thread.start()
+sat_state_thread = threading.Thread(target=consume_satellite_state, daemon=True)
+sat_state_thread.start()
 
 def process_simulation_step():
     """
@@ -513,9 +576,13 @@ def process_simulation_step():
     - Run prediction combining satellite position + meteo propagation
     - Publish risk map
     """
+    cycle_start = time.perf_counter()
     predictor.update_weather_from_sensors(known_sensors)
 
-    predictor.calculate_prediction(steps=PREDICTION_STEPS)
+    # The forecast gets what the weather update left of its share of the cycle,
+    # the rest is kept for the risk map and the GUI
+    deadline = cycle_start + FORECAST_SHARE * CYCLE_PERIOD
+    predictor.calculate_prediction(steps=PREDICTION_STEPS, deadline=deadline)
     predictor.publish_risk_map()
 
     # Status reporting
@@ -559,20 +626,22 @@ if PLOT:
 
         return [matrice, points, titre]
 
-    ani = animation.FuncAnimation(fig, update, frames=100, interval=500, blit=False)
+    ani = animation.FuncAnimation(fig, update, frames=100, interval=CYCLE_PERIOD * 1000, blit=False)
     plt.show()
 
 else:
     print("Démarrage en mode HEADLESS (PLOT=False)")
     try:
         while True:
+            cycle_start = time.perf_counter()
             success, status = process_simulation_step()
             if success:
                 pass
             else:
                 print(f"[Wait] {status}")
             stdout.flush()
-            time.sleep(1.0)
+            # Fixed rate: the step time is part of the cycle
+            time.sleep(max(0.0, CYCLE_PERIOD - (time.perf_counter() - cycle_start)))
 
     except KeyboardInterrupt:
         print("Arrêt du script.")
\ No newline at end of file
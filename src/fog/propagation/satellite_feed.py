@@ -0,0 +1,64 @@
+import struct
+import zlib
+import numpy as np
+
+# Compact satellite state feed, as encoded by edge/simulation/satellite.py
+FEED_MAGIC = b"SATF"
+FEED_VERSION = 1
+KEYFRAME = 0
+DELTA_FRAME = 1
+# magic, version, frame type, sequence number, height, width, bbox (min_lon, min_lat, max_lon, max_lat)
+FEED_HEADER = struct.Struct(">4sBBIHH4d")
+
+# Feed state (0=burnt, 1=vegetation, 2=burning) -> satellite mask (0=vegetation, 1=fire, 2=burnt)
+STATE_TO_MASK = np.array([2, 0, 1], dtype=np.uint8)
+
+
+def unpack_states(data, count):
+    packed = np.frombuffer(data, dtype=np.uint8)
+    states = np.stack([packed >> 6, (packed >> 4) & 3, (packed >> 2) & 3, packed & 3], axis=1)
+    return states.ravel()[:count]
+
+
+class SatelliteFeedDecoder:
+    """
+    Rebuilds the satellite state raster from keyframes and delta frames.
+    A delta frame is only applied on top of the frame that directly precedes
+    it; after a gap the decoder waits for the next keyframe.
+    """
+
+    def __init__(self):
+        self.states = None
+        self.sequence = None
+        self.bbox = None
+
+    def decode(self, payload):
+        """Apply one frame, return True when the raster was updated."""
+        magic, version, frame_type, sequence, height, width, *bbox = FEED_HEADER.unpack_from(payload)
+        if magic != FEED_MAGIC or version != FEED_VERSION:
+            raise ValueError(f"Unsupported satellite frame {magic!r} v{version}")
+        body = zlib.decompress(payload[FEED_HEADER.size:])
+
+        if frame_type == KEYFRAME:
+            self.states = unpack_states(body, height * width).reshape(height, width)
+        elif frame_type == DELTA_FRAME:
+            expected = None if self.sequence is None else (self.sequence + 1) % 2**32
+            if self.states is None or sequence != expected or self.states.shape != (height, width):
+                self.sequence = None
+                return False
+            (count,) = struct.unpack_from(">I", body)
+            cells = np.cumsum(np.frombuffer(body, dtype=">u4", count=count, offset=4))
+            self.states.flat[cells] = unpack_states(body[4 + 4 * count:], count)
+        else:
+            raise ValueError(f"Unknown satellite frame type {frame_type}")
+
+        self.sequence = sequence
+        self.bbox = tuple(bbox)
+        return True
+
+    def mask(self, size):
+        # Nearest-cell resampling to the prediction grid, states are kept exact
+        height, width = self.states.shape
+        rows = np.arange(size) * height // size
+        cols = np.arange(size) * width // size
+        return STATE_TO_MASK[self.states[np.ix_(rows, cols)]]